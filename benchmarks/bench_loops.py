@@ -0,0 +1,53 @@
+"""
+Benchmark reshaping many independent loops with per-loop stages in the calling process and in worker processes sharing
+mesh arrays (see perfect_shape.sharedmem), runs without Blender. Speedup needs more than one CPU core.
+
+    python benchmarks/bench_loops.py [loops] [loop vertices] [workers]
+"""
+import os
+import sys
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from perfect_shape import core, sharedmem
+
+
+def loops_mesh(loops, count):
+    rng = numpy.random.RandomState(0)
+    angles = numpy.linspace(0, 2 * numpy.pi, count, endpoint=False)
+    verts = []
+    for idx in range(loops):
+        radius = 1 + 0.2 * rng.uniform(-1, 1, count)
+        verts.append(numpy.column_stack((numpy.cos(angles) * radius + idx * 3, numpy.sin(angles) * radius,
+                                         rng.uniform(-0.05, 0.05, count))))
+    starts = numpy.arange(loops)[:, None] * count
+    edges = numpy.stack((starts + numpy.arange(count), starts + (numpy.arange(count) + 1) % count), axis=2)
+    return numpy.concatenate(verts), edges.reshape(-1, 2), core.pack_faces([])
+
+
+def main(loops=500, count=64, workers=os.cpu_count()):
+    verts, edges, faces = loops_mesh(loops, count)
+    selection = (numpy.arange(len(verts)), numpy.arange(len(edges)), ())
+    params = {"fit_rotation": True}
+
+    times = []
+    for processes in (False, True):
+        start = time.perf_counter()
+        result = core.reshape(verts, edges, faces, selection, params, workers=workers, processes=processes)[0]
+        times.append(time.perf_counter() - start)
+        if not processes:
+            expected = result
+    assert numpy.allclose(result, expected)
+
+    print("loops: {} of {} vertices, {} CPU cores".format(loops, count, os.cpu_count()))
+    print("calling process: {:.3f}s".format(times[0]))
+    if workers > 1 and sharedmem.is_available():
+        print("{} processes: {:.3f}s ({:.2f}x)".format(workers, times[1], times[0] / times[1]))
+    else:
+        print("processes: not used, needs more than 1 worker and shared memory")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
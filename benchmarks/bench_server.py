@@ -0,0 +1,69 @@
+"""
+Load test of the local job server, server and clients run in one process, jobs in server worker processes.
+
+    python benchmarks/bench_server.py [clients] [jobs per client] [grid size] [workers] [max pending]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from perfect_shape.server import JobServer, pack_mesh, unpack_verts
+from perfect_shape.client import JobClient
+
+
+def grid_mesh(size):
+    """
+    Return grid mesh payload with tagged loop around inner square of vertices
+    """
+    verts = [(x, y, 0.0) for y in range(size) for x in range(size)]
+    faces = [(y * size + x, y * size + x + 1, (y + 1) * size + x + 1, (y + 1) * size + x)
+             for y in range(size - 1) for x in range(size - 1)]
+    low, high = size // 4, size - 1 - size // 4
+    ring = ([low * size + x for x in range(low, high)] + [y * size + high for y in range(low, high)] +
+            [high * size + x for x in range(high, low, -1)] + [y * size + low for y in range(high, low, -1)])
+    return pack_mesh(verts, faces, numpy.column_stack((ring, numpy.roll(ring, -1))))
+
+
+async def run_client(path, payload, jobs, statuses, latencies):
+    client = JobClient()
+    await client.connect(path)
+
+    async def job():
+        start = time.perf_counter()
+        header, result = await client.submit(payload, {"fit_rotation": True})
+        latencies.append(time.perf_counter() - start)
+        statuses[header["status"]] = statuses.get(header["status"], 0) + 1
+        if header["status"] == "done":
+            assert len(unpack_verts(result)) == len(unpack_verts(payload))
+
+    await asyncio.gather(*[job() for idx in range(jobs)])
+    await client.close()
+
+
+async def main(clients=8, jobs=25, size=40, workers=None, max_pending=8):
+    path = os.path.join(tempfile.mkdtemp(), "perfect_shape.sock")
+    server = JobServer(workers, max_pending)
+    await server.start(path)
+    payload = grid_mesh(size)
+    statuses = {}
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(path, payload, jobs, statuses, latencies) for idx in range(clients)])
+    total_time = time.perf_counter() - start
+    await server.close()
+
+    latencies.sort()
+    print("jobs: {} from {} clients, mesh of {} vertices".format(clients * jobs, clients, size * size))
+    print("statuses: {}".format(statuses))
+    print("throughput: {:.1f} jobs/s".format(len(latencies) / total_time))
+    print("latency: p50 {:.3f}s, p95 {:.3f}s, max {:.3f}s".format(
+        latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)], latencies[-1]))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,43 @@
+"""
+Benchmark batched surface wrapping with the NumPy triangle BVH, runs without Blender.
+
+    python benchmarks/bench_wrap.py [grid size] [shape vertices]
+"""
+import os
+import sys
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from perfect_shape.raycast import TriangleBVH, wrap
+
+
+def grid_surface(size):
+    xs, ys = numpy.meshgrid(numpy.linspace(-1, 1, size), numpy.linspace(-1, 1, size))
+    verts = numpy.column_stack((xs.ravel(), ys.ravel(), 0.1 * numpy.sin(3 * xs.ravel())))
+    idx = numpy.arange(size * size).reshape(size, size)
+    a, b, c, d = idx[:-1, :-1].ravel(), idx[1:, :-1].ravel(), idx[1:, 1:].ravel(), idx[:-1, 1:].ravel()
+    return verts, numpy.concatenate((numpy.column_stack((a, b, c)), numpy.column_stack((a, c, d))))
+
+
+def main(size=300, count=100000):
+    verts, triangles = grid_surface(size)
+    start = time.perf_counter()
+    bvh = TriangleBVH(verts, triangles)
+    build_time = time.perf_counter() - start
+
+    rng = numpy.random.RandomState(0)
+    origins = numpy.column_stack((rng.uniform(-1, 1, (count, 2)), rng.uniform(-0.5, 0.5, count)))
+    directions = numpy.tile((0.0, 0.0, 1.0), (count, 1))
+    start = time.perf_counter()
+    positions, mask = wrap(bvh, origins, directions)
+    wrap_time = time.perf_counter() - start
+
+    print("triangles: {}, build: {:.3f}s".format(len(triangles), build_time))
+    print("vertices: {}, hits: {}, wrap: {:.3f}s ({:.0f} vertices/s)".format(
+        count, int(mask.sum()), wrap_time, count / wrap_time))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,52 @@
+"""
+Benchmark writing reshaped loop vertices back to the mesh with core.blend_loops and shaper.write_verts, runs without
+Blender.
+
+Vertices are stand-in objects with a 'co' attribute, like BMesh vertices. Blending is one array operation over all
+loops, writing stays one Python assignment per vertex since BMesh has no bulk coordinate setter, both are reported.
+
+    python benchmarks/bench_writeback.py [loops] [loop vertices]
+"""
+import os
+import sys
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from perfect_shape import core, shapes
+from perfect_shape.shaper import write_verts
+
+
+class Vert:
+    __slots__ = ("co",)
+
+    def __init__(self, co):
+        self.co = co
+
+
+def main(loops=100, count=10000):
+    rng = numpy.random.RandomState(0)
+    verts_co = rng.uniform(-1, 1, (loops * count, 3))
+    alignments = [(list(range(idx * count, (idx + 1) * count)), None, False) for idx in range(loops)]
+    wraps = [(shapes.circle(count, 1.0), None, None) for idx in range(loops)]
+    verts = [Vert(tuple(co)) for co in verts_co.tolist()]
+    total = loops * count
+
+    start = time.perf_counter()
+    indices, blended = core.blend_loops(verts_co, alignments, wraps, 50)
+    blend_time = time.perf_counter() - start
+    start = time.perf_counter()
+    write_verts(verts, indices, blended)
+    write_time = time.perf_counter() - start
+
+    expected = verts_co + (numpy.concatenate([wrapped[0] for wrapped in wraps]) - verts_co) * 0.5
+    assert numpy.allclose(numpy.array([vert.co for vert in verts]), expected)
+
+    print("vertices: {} in {} loops".format(total, loops))
+    print("blend_loops: {:.3f}s ({:.0f} vertices/s)".format(blend_time, total / blend_time))
+    print("write_verts: {:.3f}s ({:.0f} vertices/s)".format(write_time, total / write_time))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
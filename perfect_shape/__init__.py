@@ -7,11 +7,16 @@ bl_info = {
     "category": "Mesh"
 }
 
-import bpy
-from perfect_shape import properties
-from perfect_shape import operators
-from perfect_shape import user_interface
-from perfect_shape import utils
+try:
+    import bpy
+except ImportError:
+    # Geometry modules (shaper, shapes, raycast) are usable outside of Blender
+    bpy = None
+else:
+    from perfect_shape import properties
+    from perfect_shape import operators
+    from perfect_shape import user_interface
+    from perfect_shape import utils
 
 
 def register():
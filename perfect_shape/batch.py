@@ -0,0 +1,182 @@
+"""
+Reshape loops of mesh files without Blender.
+
+Loops are taken from tagged edges ('l' polylines of OBJ, 'edge' elements of PLY, 'tagged_edges' of NPZ) or from
+a vertex group. Only vertex positions are changed, topology edits of the operator (fill, inset, extrude) are not
+applied. Files are processed by a pool of worker processes, workers are replaced after a number of files to keep
+their memory bounded.
+
+    python -m perfect_shape.batch --shape CIRCLE -o out/ meshes/*.obj
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import numpy
+from perfect_shape import core
+from perfect_shape.meshfile import read_mesh, write_mesh, MeshFileException
+from perfect_shape.library import open_library, LibraryException
+from perfect_shape.pipeline import StageError
+
+
+def get_selection(mesh, edges, group=None):
+    """
+    Return selection of tagged edges or of vertex group, faces with all edges selected are selected too
+    :param mesh: MeshData
+    :param edges: (E, 2) array of unique sorted edge vertex indices
+    :param group: Vertex group name, tagged edges are used if None
+    :return: tuple of selected vertex, edge and face indices arrays
+    """
+    if group is None:
+        tagged = numpy.sort(mesh.tagged_edges, axis=1)
+        edge_keys = edges[:, 0] * len(mesh.verts) + edges[:, 1]
+        selected_edges = numpy.flatnonzero(numpy.isin(edge_keys, tagged[:, 0] * len(mesh.verts) + tagged[:, 1]))
+    else:
+        if group not in mesh.vertex_groups:
+            raise MeshFileException("No vertex group '{}'".format(group))
+        selected = numpy.zeros(len(mesh.verts), dtype=bool)
+        selected[mesh.vertex_groups[group]] = True
+        selected_edges = numpy.flatnonzero(selected[edges].all(axis=1))
+
+    polygons_start, polygons_total, loops_vert = mesh.faces
+    selected_faces = numpy.zeros(0, dtype=numpy.int64)
+    if len(loops_vert):
+        is_edge_selected = numpy.zeros(len(edges), dtype=numpy.int64)
+        is_edge_selected[selected_edges] = 1
+        loops_selected = is_edge_selected[core.get_face_edges(edges, mesh.faces, len(mesh.verts))]
+        selected_faces = numpy.flatnonzero(numpy.add.reduceat(loops_selected, polygons_start) == polygons_total)
+    selected_verts = numpy.unique(edges[selected_edges])
+    return selected_verts, selected_edges, selected_faces
+
+
+def reshape_mesh(mesh, params, group=None):
+    """
+    Reshape loops of tagged edges or vertex group of mesh
+    :param mesh: MeshData
+    :return: tuple of (V, 3) array of new vertex coordinates, list of edits (see core.get_edits) and warnings
+    """
+    edges = mesh.get_edges()
+    selection = get_selection(mesh, edges, group)
+    if len(selection[1]) == 0:
+        return mesh.verts, [], []
+    return core.reshape(mesh.verts, edges, mesh.faces, selection, params)
+
+
+def process_file(task):
+    """
+    Reshape loops of one file, runs in worker process
+    :param task: tuple of input path, output path, reshape parameters and vertex group name
+    :return: tuple of input path, number of reshaped loops, warnings and error message or None
+    """
+    path, output_path, params, group = task
+    try:
+        verts, edits, warnings = reshape_mesh(read_mesh(path), params, group)
+        if edits or output_path != path:
+            write_mesh(path, output_path, verts)
+        return path, len(edits), warnings, None
+    except Exception as e:
+        # Failure is reported for the file, an exception raised out of worker would end the whole pool run
+        return path, 0, [], str(e) or e.__class__.__name__
+
+
+def get_pattern_co(library_path, name):
+    """
+    Return coordinates of library pattern of given name
+    """
+    library = open_library(library_path)
+    if library is None:
+        raise LibraryException("Can't open pattern library '{}'".format(library_path))
+    for idx in range(len(library)):
+        if library.name(idx) == name:
+            return numpy.array(library.get(idx)[0], dtype=numpy.float64)
+    raise LibraryException("No pattern '{}' in '{}'".format(name, library_path))
+
+
+def get_output_path(path, output):
+    if output is None:
+        return path
+    return os.path.join(output, os.path.basename(path))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m perfect_shape.batch",
+                                     description="Reshape loops of OBJ, PLY and NPZ meshes.")
+    parser.add_argument("files", nargs="+", help="Mesh files")
+    parser.add_argument("-o", "--output", help="Output directory, files are changed in place if not set")
+    parser.add_argument("-g", "--group", help="Reshape loops of vertex group instead of tagged edges")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--max-tasks", type=int, default=50, help="Files processed by worker before it is replaced")
+    parser.add_argument("--shape", choices=("CIRCLE", "RECTANGLE", "PATTERN"), default="CIRCLE")
+    parser.add_argument("--library", help="Pattern library file of PATTERN shape")
+    parser.add_argument("--pattern", help="Pattern name of PATTERN shape")
+    parser.add_argument("--span", type=int, default=0, help="Additional circle segments")
+    parser.add_argument("--ratio", type=int, nargs=2, default=(1, 1), metavar=("A", "B"), help="Rectangle ratio")
+    parser.add_argument("--square", action="store_true")
+    parser.add_argument("--pivot-point", choices=("MEDIAN_POINT", "BOUNDING_BOX_CENTER", "INDIVIDUAL_ORIGINS",
+                                                  "CURSOR"), default="MEDIAN_POINT")
+    parser.add_argument("--cursor", type=float, nargs=3, default=(0.0, 0.0, 0.0))
+    parser.add_argument("--projection", choices=("NORMAL", "X", "Y", "Z"), default="NORMAL")
+    parser.add_argument("--invert-projection", action="store_true")
+    parser.add_argument("--offset", type=float, default=0.0, help="Changes shape size")
+    parser.add_argument("--loop-rotation", action="store_true")
+    parser.add_argument("--shape-rotation", action="store_true")
+    parser.add_argument("--fit-rotation", action="store_true")
+    parser.add_argument("--shift", type=int, default=0)
+    parser.add_argument("--reverse-correspondence", action="store_true")
+    parser.add_argument("--rotation", type=float, default=0.0, help="Shape rotation in degrees")
+    parser.add_argument("--translation", type=float, nargs=3, default=(0.0, 0.0, 0.0))
+    parser.add_argument("--wrap", action="store_true", help="Cast shape to mesh surface")
+    parser.add_argument("--factor", type=int, default=100, help="Reshape factor in percents")
+    args = parser.parse_args(argv)
+    if args.shape == "PATTERN" and not (args.library and args.pattern):
+        parser.error("PATTERN shape requires --library and --pattern")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = {"shape": args.shape, "span": args.span, "ratio_a": args.ratio[0], "ratio_b": args.ratio[1],
+              "is_square": args.square, "pivot_point": args.pivot_point, "cursor": tuple(args.cursor),
+              "projection": args.projection, "invert_projection": args.invert_projection, "offset": args.offset,
+              "loop_rotation": args.loop_rotation, "shape_rotation": args.shape_rotation,
+              "fit_rotation": args.fit_rotation, "shift": args.shift,
+              "reverse_correspondence": args.reverse_correspondence, "rotation": math.radians(args.rotation),
+              "shape_translation": tuple(args.translation), "use_ray_cast": args.wrap, "factor": args.factor}
+    try:
+        core.check_params(params)
+    except StageError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.shape == "PATTERN":
+        try:
+            params["shape_co"] = get_pattern_co(args.library, args.pattern)
+        except LibraryException as e:
+            print(e, file=sys.stderr)
+            return 2
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+
+    tasks = [(path, get_output_path(path, args.output), params, args.group) for path in args.files]
+    failed = 0
+    pool = multiprocessing.Pool(args.jobs, maxtasksperchild=args.max_tasks)
+    try:
+        for path, loops_count, warnings, error in pool.imap_unordered(process_file, tasks, chunksize=1):
+            if error is not None:
+                failed += 1
+                print("{}: error: {}".format(path, error), file=sys.stderr)
+                continue
+            for warning in warnings:
+                print("{}: warning: {}".format(path, warning), file=sys.stderr)
+            print("{}: {} loops".format(path, loops_count))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class CacheException(Exception):
+    pass
+
+
+def get_size(value):
+    """
+    Return approximate memory size of cached value in bytes
+    """
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(get_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class Cache:
+    """
+    LRU cache of operator stage results, entries are keyed by owner, stage name and stage inputs
+
+    Access is serialized with a lock, stages running in worker threads share the cache.
+    """
+    def __init__(self, max_entries=512, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.RLock()
+
+    def get(self, owner, stage, inputs=()):
+        key = (owner, stage, inputs)
+        with self.lock:
+            if key not in self.entries:
+                self.misses[stage] = self.misses.get(stage, 0) + 1
+                raise CacheException("No '{}' stage cache".format(stage))
+            self.hits[stage] = self.hits.get(stage, 0) + 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def set(self, owner, stage, inputs, value, size=None):
+        key = (owner, stage, inputs)
+        size = get_size(value) if size is None else size
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                self.bytes -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self, owner=None, stage=None):
+        """
+        Remove entries of given owner and/or stage, everything if both are None
+        """
+        with self.lock:
+            for key in [k for k in self.entries
+                        if (owner is None or k[0] == owner) and (stage is None or k[1] == stage)]:
+                self.bytes -= self.entries.pop(key)[1]
+
+    def stats(self):
+        """
+        Return dictionary of entries count, bytes and per stage (hits, misses) counters
+        """
+        stages = set(self.hits) | set(self.misses)
+        return {"entries": len(self.entries),
+                "bytes": self.bytes,
+                "stages": {stage: (self.hits.get(stage, 0), self.misses.get(stage, 0)) for stage in stages}}
+
+
+cache = Cache()
+
+
+def get_cache(owner, stage, inputs=()):
+    return cache.get(owner, stage, inputs)
+
+
+def set_cache(owner, stage, inputs, value, size=None):
+    cache.set(owner, stage, inputs, value, size)
+
+
+def clear_cache(owner=None, stage=None):
+    cache.clear(owner, stage)
+
+
+def get_cache_stats():
+    return cache.stats()
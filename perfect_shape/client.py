@@ -0,0 +1,74 @@
+import asyncio
+import itertools
+from perfect_shape.server import read_message, write_message, ProtocolException
+
+
+class JobException(Exception):
+    pass
+
+
+class JobClient:
+    """
+    Client of job server, jobs can be submitted concurrently over one connection
+    """
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.listener = None
+
+    async def connect(self, path=None, host="127.0.0.1", port=8765):
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path, limit=1024 * 1024)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port, limit=1024 * 1024)
+        self.listener = asyncio.ensure_future(self.listen())
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.listener is not None:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+
+    async def listen(self):
+        error = JobException("Connection closed")
+        try:
+            while True:
+                message = await read_message(self.reader)
+                if message is None:
+                    break
+                header, payload = message
+                future = self.pending.get(header.get("id"))
+                if future is None:
+                    if header.get("status") == "error":
+                        error = JobException(header.get("error"))
+                        break
+                    continue
+                if header.get("status") != "accepted":
+                    del self.pending[header["id"]]
+                    if not future.done():
+                        future.set_result((header, payload))
+        except (ConnectionError, asyncio.IncompleteReadError, ProtocolException) as e:
+            error = JobException(str(e) or "Connection closed")
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    async def submit(self, payload, params=None, group=None, timeout=None):
+        """
+        Submit job and wait for its result
+        :param payload: Mesh in NPZ format, see server.pack_mesh
+        :param params: Dictionary of reshape parameters, see core.DEFAULT_PARAMS
+        :return: tuple of result header and reshaped mesh payload, payload is empty unless status is 'done'
+        """
+        job_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[job_id] = future
+        write_message(self.writer, {"id": job_id, "params": params or {}, "group": group, "timeout": timeout},
+                      payload)
+        await self.writer.drain()
+        return await future
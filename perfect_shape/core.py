@@ -0,0 +1,563 @@
+import math
+import numpy
+from perfect_shape import shapes, sharedmem
+from perfect_shape.shaper import walk_loops, group_regions
+from perfect_shape.correspondence import cyclic_shift, fit_rotation
+from perfect_shape.pipeline import StageError
+from perfect_shape.raycast import TriangleBVH, wrap, padded_bounds, fan_triangles
+
+# Parameters of reshape, names and defaults follow PerfectShape operator properties
+DEFAULT_PARAMS = {"shape": "CIRCLE", "span": 0, "ratio_a": 1, "ratio_b": 1, "is_square": False, "shape_co": None,
+                  "pivot_point": "MEDIAN_POINT", "cursor": (0.0, 0.0, 0.0), "projection": "NORMAL",
+                  "invert_projection": False, "offset": 0.0, "loop_rotation": False, "shape_rotation": False,
+                  "fit_rotation": False, "shift": 0, "reverse_correspondence": False, "rotation": 0.0,
+                  "shape_translation": (0.0, 0.0, 0.0), "use_ray_cast": False, "factor": 100,
+                  "fill_type": "ORIGINAL"}
+
+# Allowed values of enum parameters and (min, max) limits of number parameters, as in operator properties
+PARAM_CHOICES = {"shape": ("CIRCLE", "RECTANGLE", "PATTERN", "OBJECT"),
+                 "pivot_point": ("MEDIAN_POINT", "BOUNDING_BOX_CENTER", "INDIVIDUAL_ORIGINS", "CURSOR"),
+                 "projection": ("NORMAL", "X", "Y", "Z"), "fill_type": ("ORIGINAL", "COLLAPSE", "HOLE", "NGON")}
+PARAM_LIMITS = {"span": (0, None), "ratio_a": (1, None), "ratio_b": (1, None), "factor": (0, 100)}
+
+
+def check_params(params):
+    """
+    Check types and ranges of reshape parameters, raises StageError on invalid parameter
+    :param params: Dictionary of parameters, names missing from DEFAULT_PARAMS are not checked
+    """
+    for name, value in params.items():
+        if name == "shape_co" or name not in DEFAULT_PARAMS:
+            continue
+        default = DEFAULT_PARAMS[name]
+        if isinstance(default, bool):
+            is_valid = isinstance(value, (bool, numpy.bool_))
+        elif isinstance(default, int):
+            is_valid = isinstance(value, (int, numpy.integer)) and not isinstance(value, bool)
+        elif isinstance(default, float):
+            is_valid = isinstance(value, (int, float, numpy.number)) and not isinstance(value, bool) and \
+                math.isfinite(value)
+        elif isinstance(default, tuple):
+            is_valid = isinstance(value, (tuple, list)) and len(value) == len(default) and \
+                all(isinstance(item, (int, float)) and not isinstance(item, bool) and math.isfinite(item)
+                    for item in value)
+        else:
+            is_valid = value in PARAM_CHOICES[name]
+        if is_valid and name in PARAM_LIMITS:
+            low, high = PARAM_LIMITS[name]
+            is_valid = (low is None or value >= low) and (high is None or value <= high)
+        if not is_valid:
+            raise StageError("Invalid parameter '{}': {!r}".format(name, value))
+
+
+def pack_faces(faces):
+    """
+    Return faces in the packed form used by the mesh functions
+    :param faces: Sequence of face vertex indices sequences
+    :return: tuple of faces first loop indices, loop counts and loops vertex indices arrays
+    """
+    polygons_total = numpy.array([len(face) for face in faces], dtype=numpy.int64)
+    polygons_start = numpy.zeros(len(faces), dtype=numpy.int64)
+    numpy.cumsum(polygons_total[:-1], out=polygons_start[1:])
+    loops_vert = numpy.array([vert for face in faces for vert in face], dtype=numpy.int64)
+    return polygons_start, polygons_total, loops_vert
+
+
+def get_face_edges(edges, faces, verts_count):
+    """
+    Return edge index of every face loop, loop i of a face joins its vertices i and i + 1
+    :param edges: (E, 2) array of edge vertex indices
+    :param faces: Packed faces, see pack_faces
+    :return: Array of edge indices aligned with loops vertex indices
+    """
+    polygons_start, polygons_total, loops_vert = faces
+    edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+    loops_vert = numpy.asarray(loops_vert, dtype=numpy.int64)
+    if len(loops_vert) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    next_loop = numpy.arange(1, len(loops_vert) + 1)
+    next_loop[numpy.asarray(polygons_start) + numpy.asarray(polygons_total) - 1] = polygons_start
+    edge_keys = edges.min(axis=1) * verts_count + edges.max(axis=1)
+    loop_keys = (numpy.minimum(loops_vert, loops_vert[next_loop]) * verts_count +
+                 numpy.maximum(loops_vert, loops_vert[next_loop]))
+    order = numpy.argsort(edge_keys, kind="mergesort")
+    return order[numpy.searchsorted(edge_keys[order], loop_keys)]
+
+
+def get_edge_loops(edges, edge_indices, edge_faces_count):
+    """
+    Split indexed edges into vertex-ordered loops
+    :param edges: (E, 2) array of edge vertex indices
+    :param edge_indices: Indices of edges to split
+    :param edge_faces_count: Number of faces linked to each edge
+    :return: list of (success, is_cyclic, is_boundary, verts, edges) tuples
+    """
+    verts = []
+    verts_index = {}
+    edge_verts = []
+    for vert in edges[edge_indices].ravel().tolist():
+        idx = verts_index.get(vert)
+        if idx is None:
+            idx = verts_index[vert] = len(verts)
+            verts.append(vert)
+        edge_verts.append(idx)
+
+    loops = []
+    for success, is_cyclic, loop_verts, loop_edges in walk_loops(edge_verts, len(verts)):
+        loop_edges = [edge_indices[e] for e in loop_edges]
+        is_boundary = bool(numpy.any(edge_faces_count[loop_edges] == 1))
+        loops.append((success, is_cyclic, is_boundary, [verts[v] for v in loop_verts], loop_edges))
+    return loops
+
+
+def find_loops(edges, faces, verts_count, selected_edges, selected_faces=()):
+    """
+    Find loops of selection, boundaries of selected face regions first, then remaining selected edge chains
+    :param edges: (E, 2) array of edge vertex indices
+    :param faces: Packed faces, see pack_faces
+    :param verts_count: Number of vertices
+    :param selected_edges: Indices of selected edges
+    :param selected_faces: Indices of selected faces
+    :return: list of ((verts, edges, faces), is_cyclic, is_boundary) tuples of index lists
+    """
+    polygons_start, polygons_total, loops_vert = faces
+    edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+    face_edges = get_face_edges(edges, faces, verts_count)
+    edge_faces_count = numpy.bincount(face_edges, minlength=len(edges))
+    selected_edges = [int(e) for e in selected_edges]
+    selected_faces = [int(f) for f in selected_faces]
+    loops = []
+
+    if selected_faces:
+        faces_edges = [face_edges[polygons_start[f]:polygons_start[f] + polygons_total[f]].tolist()
+                       for f in selected_faces]
+        for group_edges, group_faces in group_regions(faces_edges, edge_faces_count):
+            if not group_edges:
+                continue
+            success, is_cyclic, is_boundary, loop_verts, loop_edges = get_edge_loops(edges, group_edges,
+                                                                                     edge_faces_count)[0]
+            loops.append(((loop_verts, loop_edges, [selected_faces[f] for f in group_faces]), is_cyclic,
+                          is_boundary))
+
+        used_edges = set(edge for face_edges_list in faces_edges for edge in face_edges_list)
+        selected_edges = [e for e in selected_edges if e not in used_edges]
+
+    for success, is_cyclic, is_boundary, loop_verts, loop_edges in get_edge_loops(edges, selected_edges,
+                                                                                  edge_faces_count):
+        if success:
+            loops.append(((loop_verts, loop_edges, []), is_cyclic, is_boundary))
+    return loops
+
+
+def vertex_normals(verts, faces):
+    """
+    Return vertex normals as normalized sum of linked face normals
+    :param verts: (V, 3) array of vertex coordinates
+    :param faces: Packed faces, see pack_faces
+    :return: (V, 3) array of normals
+    """
+    polygons_start, polygons_total, loops_vert = faces
+    verts = numpy.asarray(verts, dtype=numpy.float64)
+    loops_vert = numpy.asarray(loops_vert, dtype=numpy.int64)
+    normals = numpy.zeros(verts.shape)
+    if len(loops_vert) == 0:
+        return normals
+    next_loop = numpy.arange(1, len(loops_vert) + 1)
+    next_loop[numpy.asarray(polygons_start) + numpy.asarray(polygons_total) - 1] = polygons_start
+    face_normals = numpy.add.reduceat(numpy.cross(verts[loops_vert], verts[loops_vert[next_loop]]),
+                                      polygons_start, axis=0)
+    numpy.add.at(normals, loops_vert, numpy.repeat(face_normals, polygons_total, axis=0))
+    length = numpy.sqrt((normals * normals).sum(axis=1))
+    normals[length > 0] /= length[length > 0, None]
+    return normals
+
+
+def polygon_normal(coords):
+    """
+    Return normalized polygon normal with Newell's method, like mathutils.geometry.normal
+    """
+    coords = numpy.asarray(coords, dtype=numpy.float64)
+    coords = coords - coords.mean(axis=0)
+    normal = numpy.cross(coords, numpy.roll(coords, -1, axis=0)).sum(axis=0)
+    length = math.sqrt(normal.dot(normal))
+    return normal / length if length > 0 else normal
+
+
+def quaternion_matrix(q):
+    q0, q1, q2, q3 = (math.sqrt(2) * float(value) for value in q)
+    qda, qdb, qdc = q0 * q1, q0 * q2, q0 * q3
+    qaa, qab, qac = q1 * q1, q1 * q2, q1 * q3
+    qbb, qbc, qcc = q2 * q2, q2 * q3, q3 * q3
+    return numpy.array(((1.0 - qbb - qcc, -qdc + qab, qdb + qac),
+                        (qdc + qab, 1.0 - qaa - qcc, -qda + qbc),
+                        (-qdb + qac, qda + qbc, 1.0 - qaa - qbb)), dtype=numpy.float32)
+
+
+def quaternion_multiply(a, b):
+    return (a[0] * b[0] - a[1] * b[1] - a[2] * b[2] - a[3] * b[3],
+            a[0] * b[1] + a[1] * b[0] + a[2] * b[3] - a[3] * b[2],
+            a[0] * b[2] + a[2] * b[0] + a[3] * b[1] - a[1] * b[3],
+            a[0] * b[3] + a[3] * b[0] + a[1] * b[2] - a[2] * b[1])
+
+
+def track_matrix(forward):
+    """
+    Return 4x4 rotation matrix pointing Z axis along forward, same as Vector.to_track_quat('Z', 'Y').to_matrix()
+    Computed in single precision like Blender, so orientation of axis aligned loops matches exactly.
+    """
+    f32 = numpy.float32
+    x, y, z = numpy.asarray(forward, dtype=f32)
+    matrix = numpy.identity(4)
+    length = numpy.sqrt(x * x + y * y + z * z)
+    if length == 0:
+        return matrix
+    nor = numpy.array((-y, x, 0.0), dtype=f32)
+    if abs(x) + abs(y) < f32(1e-4):
+        nor[0] = 1.0
+    nor_length = nor.dot(nor)
+    nor = nor / numpy.sqrt(nor_length) if nor_length > f32(1e-35) else numpy.zeros(3, dtype=f32)
+    co = z / length
+    phi = f32(0.5) * (f32(math.pi) if co <= -1 else f32(0.0) if co >= 1 else numpy.arccos(co))
+    si = numpy.sin(phi)
+    q = (numpy.cos(phi), nor[0] * si, nor[1] * si, nor[2] * si)
+    fp = quaternion_matrix(q)[:, 2]
+    angle = f32(-0.5) * numpy.arctan2(-fp[0], -fp[1])
+    si = numpy.sin(angle) / length
+    matrix[:3, :3] = quaternion_matrix(quaternion_multiply((numpy.cos(angle), x * si, y * si, z * si), q))
+    return matrix
+
+
+def translation_matrix(vector):
+    matrix = numpy.identity(4)
+    matrix[:3, 3] = vector
+    return matrix
+
+
+def rotation_z_matrix(angle):
+    matrix = numpy.identity(4)
+    matrix[:2, :2] = ((math.cos(angle), -math.sin(angle)), (math.sin(angle), math.cos(angle)))
+    return matrix
+
+
+def scale_matrix(factor):
+    matrix = numpy.identity(4) * factor
+    matrix[3, 3] = 1.0
+    return matrix
+
+
+def box_fit_2d(points):
+    """
+    Return angle of minimal area bounding rectangle, same convention as mathutils.geometry.box_fit_2d
+    :param points: (N, 2) array of coordinates
+    """
+    points = numpy.unique(numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2), axis=0)
+    if len(points) < 2:
+        return 0.0
+
+    def half_hull(points):
+        hull = []
+        for point in points.tolist():
+            while len(hull) > 1 and ((hull[-1][0] - hull[-2][0]) * (point[1] - hull[-2][1]) -
+                                     (hull[-1][1] - hull[-2][1]) * (point[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(point)
+        return hull[:-1]
+
+    hull = numpy.array(half_hull(points) + half_hull(points[::-1]))
+    directions = hull - numpy.roll(hull, 1, axis=0)
+    lengths = numpy.sqrt((directions * directions).sum(axis=1))
+    directions = directions[lengths > 0] / lengths[lengths > 0, None]
+    # Hull rotated clockwise by each edge direction, the edge becomes the X axis
+    xs = numpy.dot(directions, hull.T)
+    ys = numpy.dot(directions[:, ::-1] * (-1, 1), hull.T)
+    areas = (xs.max(axis=1) - xs.min(axis=1)) * (ys.max(axis=1) - ys.min(axis=1))
+    best = directions[int(numpy.argmin(areas))]
+    return math.atan2(best[0], best[1])
+
+
+def edges_length(verts, edges, edge_indices):
+    vectors = verts[edges[edge_indices, 1]] - verts[edges[edge_indices, 0]]
+    return numpy.sqrt((vectors * vectors).sum(axis=1)).sum()
+
+
+def make_shapes(verts, edges, loops, params):
+    """
+    Generate shape of each loop
+    :param params: Dictionary of reshape parameters, 'shape_co' holds coordinates of 'OBJECT' and 'PATTERN' shapes
+    :return: tuple of list of (N, 3) shape coordinates arrays, None for skipped loops, and list of warnings
+    """
+    verts = numpy.asarray(verts, dtype=numpy.float64)
+    edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+    shape = params["shape"]
+    shape_cos = []
+    warnings = []
+    for (loop_verts, loop_edges, loop_faces), is_loop_cyclic, is_loop_boundary in loops:
+        shape_co = None
+        loop_verts_len = len(loop_verts)
+        if len(loop_edges) < 3:
+            shape_cos.append(shape_co)
+            continue
+
+        if shape == "CIRCLE":
+            a = edges_length(verts, edges, loop_edges) / loop_verts_len
+            diameter = a / (2 * math.sin(math.pi / loop_verts_len))
+            shape_co = shapes.circle(loop_verts_len + params["span"], diameter)
+
+        elif shape == "RECTANGLE":
+            if loop_verts_len % 2 > 0:
+                raise StageError("An odd number of edges.")
+            if not shapes.rectangle_segments(loop_verts_len, params["ratio_a"], params["ratio_b"])[2]:
+                warnings.append("Incorrect sides ratio.")
+            size = edges_length(verts, edges, loop_edges)
+            shape_co = shapes.rectangle(loop_verts_len, size, params["ratio_a"], params["ratio_b"],
+                                        params["is_square"])
+
+        elif params["shape_co"] is not None:
+            shape_co = numpy.asarray(params["shape_co"], dtype=numpy.float64).reshape(-1, 3)
+            if shape == "PATTERN":
+                if len(shape_co) == 0:
+                    raise StageError("Empty Pattern Data.")
+                if len(shape_co) != loop_verts_len:
+                    raise StageError("Pattern and loop vertices count must be the same.")
+            elif len(shape_co) > loop_verts_len:
+                raise StageError("Shape and loop vertices count must be the same.")
+        if shape in ("CIRCLE", "RECTANGLE") and not shapes.is_counter_clockwise(shape_co):
+            # Generated shapes must wind like loops oriented by compute_frames, else vertices land mirrored
+            shape_co = shapes.reverse(shape_co)
+        shape_cos.append(shape_co)
+    return shape_cos, warnings
+
+
+def compute_frames(verts, loops, normals, selection_center, params):
+    """
+    Compute placement frame of each loop
+    :param normals: (V, 3) array of vertex normals
+    :param selection_center: Mean of selected vertices
+    :return: list of (center, forward, is_reversed, rotation_m) tuples, None for skipped loops
+    """
+    verts = numpy.asarray(verts, dtype=numpy.float64)
+    selection_center = numpy.asarray(selection_center, dtype=numpy.float64)
+    pivot_point = params["pivot_point"]
+    frames = []
+    for (loop_verts, loop_edges, loop_faces), is_loop_cyclic, is_loop_boundary in loops:
+        if len(loop_edges) < 3:
+            frames.append(None)
+            continue
+        loop_co = verts[loop_verts]
+
+        if pivot_point == "CURSOR":
+            center = numpy.array(params["cursor"], dtype=numpy.float64)
+        elif pivot_point == "BOUNDING_BOX_CENTER":
+            center = (loop_co.min(axis=0) + loop_co.max(axis=0)) / 2
+        else:
+            center = loop_co.mean(axis=0)
+
+        if params["projection"] == "NORMAL":
+            forward = polygon_normal(loop_co)
+            normal_forward = numpy.asarray(normals, dtype=numpy.float64)[loop_verts].sum(axis=0)
+            lengths = math.sqrt(forward.dot(forward) * normal_forward.dot(normal_forward))
+            if lengths > 0:
+                angle = math.acos(min(max(forward.dot(normal_forward) / lengths, -1.0), 1.0))
+                if angle - math.pi / 2 >= 1e-6:
+                    forward = -forward
+        else:
+            forward = numpy.array([float(axis == params["projection"]) for axis in ("X", "Y", "Z")])
+
+        if params["invert_projection"]:
+            forward = -forward
+
+        rotation_m = 1
+        if pivot_point != "INDIVIDUAL_ORIGINS":
+            if (center + selection_center).dot(forward) > 0:
+                rotation_m = -1
+
+        is_clockwise = forward.dot(numpy.cross(loop_co[0] - center, loop_co[1] - center)) > 0
+        frames.append((tuple(center.tolist()), tuple(forward.tolist()), not is_clockwise, rotation_m))
+    return frames
+
+
+def compute_alignments(verts, loops, frames, shape_cos, params, correspondence=cyclic_shift, box_fit=box_fit_2d):
+    """
+    Compute shape rotation and loop vertices order of each loop
+    :param correspondence: Function (loop_co, shape_co, allow_reverse) returning (shift, is_reversed)
+    :param box_fit: Function returning minimal bounding rectangle angle of list of 2D points
+    :return: list of (ordered vertex indices, 4x4 align matrix, is_reversed) tuples, None for skipped loops
+    """
+    verts = numpy.asarray(verts, dtype=numpy.float64)
+    offset = params["offset"]
+    alignments = []
+    for loop, frame, shape_co in zip(loops, frames, shape_cos):
+        if frame is None or shape_co is None:
+            alignments.append(None)
+            continue
+        loop_verts = loop[0][0]
+        center, forward, is_reversed, rotation_m = frame
+        if is_reversed:
+            loop_verts = loop_verts[::-1]
+
+        matrix_rotation = track_matrix(forward)
+        loop_co = verts[loop_verts]
+        loop_verts_co_2d = shapes.project_2d(loop_co - center, matrix_rotation)
+        shape_verts_co_2d = shape_co[:, :2] * (1 + offset)
+
+        correct_angle = 0
+        if params["fit_rotation"]:
+            correct_angle = -fit_rotation(loop_verts_co_2d, shape_verts_co_2d, params["reverse_correspondence"])
+        else:
+            if params["loop_rotation"]:
+                correct_angle = box_fit(loop_verts_co_2d.tolist())
+            if params["shape_rotation"]:
+                correct_angle += box_fit(shape_verts_co_2d.tolist())
+
+        matrix_placement = numpy.dot(translation_matrix(center), matrix_rotation)
+        matrix_align = numpy.dot(rotation_z_matrix(-correct_angle), scale_matrix(1 + offset))
+        shift, is_shift_reversed = correspondence(loop_co, shapes.transform(shape_co, numpy.dot(matrix_placement,
+                                                                                                 matrix_align)),
+                                                  params["reverse_correspondence"])
+        if is_shift_reversed:
+            loop_verts = loop_verts[::-1]
+            is_reversed = not is_reversed
+        shift = (shift + params["shift"]) % len(loop_verts)
+        alignments.append((loop_verts[shift:] + loop_verts[:shift], matrix_align, is_reversed))
+    return alignments
+
+
+def compute_placements(frames, alignments, shape_cos, params):
+    """
+    Place shapes on loops
+    :return: list of ((N, 3) shape coordinates, center) tuples, None for skipped loops
+    """
+    placements = []
+    for frame, alignment, shape_co in zip(frames, alignments, shape_cos):
+        if alignment is None:
+            placements.append(None)
+            continue
+        center, forward, is_reversed, rotation_m = frame
+        center = numpy.add(center, params["shape_translation"])
+        matrix = translation_matrix(center)
+        for step in (track_matrix(forward), rotation_z_matrix(-params["rotation"] * rotation_m), alignment[1]):
+            matrix = numpy.dot(matrix, step)
+        placements.append((shapes.transform(shape_co, matrix), tuple(center.tolist())))
+    return placements
+
+
+def compute_wraps(loops, frames, placements, params, get_ray_caster):
+    """
+    Cast placed shapes of loops which are not on mesh boundary to the surface along their frame direction
+    :param get_ray_caster: Function (bounds_min, bounds_max) returning ray caster of mesh region
+    :return: list of (shape coordinates, center, wrapped center or None) tuples, None for skipped loops
+    """
+    wrapped = [None if placement is None else placement + (None,) for placement in placements]
+    if not params["use_ray_cast"]:
+        return wrapped
+
+    wrap_loops = [idx for idx, (loop, placement) in enumerate(zip(loops, placements))
+                  if placement is not None and not loop[2]]
+    if not wrap_loops:
+        return wrapped
+
+    shape_cos = [placements[idx][0] for idx in wrap_loops]
+    origins = numpy.concatenate(shape_cos + [[placements[idx][1] for idx in wrap_loops]])
+    directions = numpy.concatenate([numpy.tile(frames[idx][1], (len(shape_co), 1))
+                                    for idx, shape_co in zip(wrap_loops, shape_cos)] +
+                                   [[frames[idx][1] for idx in wrap_loops]])
+    positions, mask = wrap(get_ray_caster(*padded_bounds(origins)), origins, directions)
+
+    start = 0
+    centers = positions[-len(wrap_loops):].tolist()
+    for idx, shape_co, center in zip(wrap_loops, shape_cos, centers):
+        wrapped[idx] = (positions[start:start + len(shape_co)], placements[idx][1], tuple(center))
+        start += len(shape_co)
+    return wrapped
+
+
+def blend_loops(verts, alignments, wraps, factor):
+    """
+    Blend vertices of all loops towards their shape positions in one array operation
+    :param factor: Reshape factor in percents
+    :return: tuple of vertex indices and (N, 3) array of their new coordinates
+    """
+    orders = [alignment[0] for alignment in alignments if alignment is not None]
+    if not orders:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, 3))
+    targets = [wrapped[0][:len(alignment[0])] for alignment, wrapped in zip(alignments, wraps)
+               if alignment is not None]
+    indices = numpy.concatenate([numpy.asarray(order, dtype=numpy.int64) for order in orders])
+    return indices, shapes.blend(numpy.asarray(verts)[indices], numpy.concatenate(targets), factor / 100)
+
+
+def get_edits(loops, frames, alignments, wraps, params):
+    """
+    Return topology edits of reshaped loops
+    :return: list of (verts, edges, faces, center, forward, fill_center, fill_type) tuples, vertices and edges
+             in shape order, fill_type is None when loop does not enclose faces which can be refilled
+    """
+    edits = []
+    for loop, frame, alignment, wrapped in zip(loops, frames, alignments, wraps):
+        if alignment is None:
+            continue
+        (loop_verts, loop_edges, loop_faces), is_loop_cyclic, is_loop_boundary = loop
+        loop_order, matrix_align, is_reversed = alignment
+        shape_co, center, wrap_center = wrapped
+        fill_type = params["fill_type"] if not is_loop_boundary and is_loop_cyclic and loop_faces else None
+        edits.append((loop_order, loop_edges[::-1] if is_reversed else loop_edges, loop_faces, center, frame[1],
+                      wrap_center or center, fill_type))
+    return edits
+
+
+def run_loop_stages(verts, edges, normals, loops, selection_center, params):
+    """
+    Run shapes, frames, alignment and placement stages of loops
+    :return: tuple of frames, alignments, placements and warnings
+    """
+    shape_cos, warnings = make_shapes(verts, edges, loops, params)
+    frames = compute_frames(verts, loops, normals, selection_center, params)
+    alignments = compute_alignments(verts, loops, frames, shape_cos, params)
+    placements = compute_placements(frames, alignments, shape_cos, params)
+    return frames, alignments, placements, warnings
+
+
+def reshape(verts, edges, faces, selection, params, normals=None, ray_caster=None, workers=1, processes=False):
+    """
+    Reshape selected loops of mesh given as arrays
+    :param verts: (V, 3) array of vertex coordinates
+    :param edges: (E, 2) array of edge vertex indices
+    :param faces: Packed faces, see pack_faces
+    :param selection: tuple of selected vertex, edge and face indices
+    :param params: Dictionary of parameters, missing ones are taken from DEFAULT_PARAMS
+    :param normals: (V, 3) array of vertex normals, computed from faces if None
+    :param ray_caster: Object with batched ray_cast(origins, directions), TriangleBVH of faces if None
+    :param workers: Number of worker processes if processes is True
+    :param processes: Run per-loop stages in worker processes sharing mesh arrays, stages run in calling process if
+                      shared memory is not available
+    :return: tuple of (V, 3) array of new vertex coordinates, list of edits (see get_edits) and warnings
+    """
+    check_params(params)
+    params = dict(DEFAULT_PARAMS, **params)
+    verts = numpy.asarray(verts, dtype=numpy.float64).reshape(-1, 3)
+    edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+    selected_verts, selected_edges, selected_faces = selection
+    if normals is None:
+        normals = vertex_normals(verts, faces)
+    if ray_caster is None:
+        def get_ray_caster(bounds_min, bounds_max):
+            return TriangleBVH(verts, fan_triangles(*faces))
+    else:
+        def get_ray_caster(bounds_min, bounds_max):
+            return ray_caster
+    selection_center = verts[numpy.asarray(selected_verts, dtype=numpy.int64)].mean(axis=0) \
+        if len(selected_verts) else numpy.zeros(3)
+
+    loops = find_loops(edges, faces, len(verts), selected_edges, selected_faces)
+    if processes and workers > 1 and sharedmem.is_available():
+        frames, alignments, placements, warnings = sharedmem.run_loop_stages(verts, edges, normals, loops,
+                                                                             selection_center, params, workers)
+    else:
+        frames, alignments, placements, warnings = run_loop_stages(verts, edges, normals, loops, selection_center,
+                                                                   params)
+    wraps = compute_wraps(loops, frames, placements, params, get_ray_caster)
+
+    new_verts = verts.copy()
+    indices, blended = blend_loops(verts, alignments, wraps, params["factor"])
+    new_verts[indices] = blended
+    return new_verts, get_edits(loops, frames, alignments, wraps, params), warnings
@@ -0,0 +1,80 @@
+import numpy
+
+
+def circular_correlation(a, b):
+    """
+    Return circular cross-correlation of two closed polylines for every cyclic shift in O(n log n)
+    :param a: (N, D) array of coordinates
+    :param b: (N, D) array of coordinates
+    :return: (N,) array, item s is sum of dot(a[(i + s) % N], b[i])
+    """
+    spectrum = numpy.fft.rfft(a, axis=0) * numpy.conj(numpy.fft.rfft(b, axis=0))
+    return numpy.fft.irfft(spectrum.sum(axis=1), n=len(a))
+
+
+def matched_norms(loop_co, count):
+    """
+    Return sum of squared norms of loop vertices matched to shape for every cyclic shift
+    :param loop_co: (N, D) array of loop coordinates
+    :param count: Number of matched shape vertices, first ones
+    :return: (N,) array, item s is sum of |loop_co[(i + s) % N]|^2 for i < count
+    """
+    if count >= len(loop_co):
+        return numpy.full(len(loop_co), (loop_co * loop_co).sum())
+    mask = numpy.zeros((len(loop_co), 1))
+    mask[:count] = 1
+    return circular_correlation((loop_co * loop_co).sum(axis=1)[:, None], mask)
+
+
+def cyclic_shift(loop_co, shape_co, allow_reverse=False):
+    """
+    Find cyclic vertex correspondence minimizing total squared displacement of loop vertices
+    :param loop_co: (N, D) array of loop coordinates
+    :param shape_co: (M, D) array of shape coordinates, only first N are used, missing are not matched
+    :param allow_reverse: Test also reversed loop order
+    :return: shift and reversed flag, shape vertex i corresponds to loop vertex (i + shift) % N of
+             the loop order, reversed first if flag is True
+    """
+    loop_co = numpy.asarray(loop_co, dtype=numpy.float64)
+    target = numpy.zeros(loop_co.shape)
+    count = min(len(loop_co), len(shape_co))
+    target[:count] = numpy.asarray(shape_co, dtype=numpy.float64)[:count]
+
+    # Squared displacement is |a|^2 + |b|^2 - 2 a.b summed over matched vertices, |b|^2 does not depend on the shift.
+    # Shape is zero padded, |a|^2 of unmatched loop vertices is excluded by correlating with the matched positions
+    score = 2 * circular_correlation(loop_co, target) - matched_norms(loop_co, count)
+    shift = int(numpy.argmax(score))
+    if allow_reverse:
+        reversed_score = 2 * circular_correlation(loop_co[::-1], target) - matched_norms(loop_co[::-1], count)
+        reversed_shift = int(numpy.argmax(reversed_score))
+        if reversed_score[reversed_shift] > score[shift] + 1e-9 * abs(score[shift]):
+            return reversed_shift, True
+    return shift, False
+
+
+def fit_rotation(loop_co, shape_co, allow_reverse=False):
+    """
+    Find rotation of shape around origin minimizing total squared displacement of loop vertices, solved jointly
+    with cyclic correspondence: for each shift the orthogonal Procrustes (2D Kabsch) angle is atan2(cross, dot)
+    of correlations and the residual decreases with their magnitude
+    :param loop_co: (N, 2) array of loop coordinates, centered
+    :param shape_co: (M, 2) array of shape coordinates, centered
+    :param allow_reverse: Test also reversed loop order
+    :return: Counterclockwise rotation angle in radians
+    """
+    loop_co = numpy.asarray(loop_co, dtype=numpy.float64)
+    target = numpy.zeros(loop_co.shape)
+    count = min(len(loop_co), len(shape_co))
+    target[:count] = numpy.asarray(shape_co, dtype=numpy.float64)[:count]
+
+    best = None
+    for candidate in (loop_co, loop_co[::-1]) if allow_reverse else (loop_co,):
+        dot = circular_correlation(candidate, target)
+        cross = (circular_correlation(candidate[:, 1:], target[:, :1]) -
+                 circular_correlation(candidate[:, :1], target[:, 1:]))
+        # Residual after the best rotation is |a|^2 + |b|^2 - 2 sqrt(dot^2 + cross^2) over matched vertices
+        score = 2 * numpy.sqrt(dot * dot + cross * cross) - matched_norms(candidate, count)
+        shift = int(numpy.argmax(score))
+        if best is None or score[shift] > best[0]:
+            best = (score[shift], numpy.arctan2(cross[shift], dot[shift]))
+    return float(best[1])
@@ -0,0 +1,137 @@
+import os
+import numpy
+
+MAGIC = b"PSL1"
+VERSION = 1
+ALIGNMENT = 16
+
+HEADER = numpy.dtype([("magic", "S4"), ("version", "<u4"), ("count", "<u8"), ("index_offset", "<u8")])
+RECORD = numpy.dtype([("name", "S64"), ("co_offset", "<u8"), ("faces_offset", "<u8"),
+                      ("verts_count", "<u4"), ("faces_count", "<u4")])
+
+
+class LibraryException(Exception):
+    pass
+
+
+def aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class PatternLibrary:
+    """
+    Read-only view of pattern library file, pattern data is memory-mapped and paged in only when accessed
+
+    File layout: header, aligned float32 coordinate and int32 triangle blocks, index of records at the end.
+    """
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.data = numpy.memmap(path, dtype=numpy.uint8, mode="r")
+        except (OSError, ValueError) as e:
+            raise LibraryException("Can't open pattern library '{}': {}".format(path, e))
+        if len(self.data) < HEADER.itemsize:
+            raise LibraryException("Not a pattern library '{}'".format(path))
+        header = self.data[:HEADER.itemsize].view(HEADER)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise LibraryException("Not a pattern library '{}'".format(path))
+        index_end = int(header["index_offset"]) + int(header["count"]) * RECORD.itemsize
+        if index_end > len(self.data):
+            raise LibraryException("Truncated pattern library '{}'".format(path))
+        self.records = self.data[int(header["index_offset"]):index_end].view(RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    def name(self, idx):
+        return self.records[idx]["name"].decode("utf-8", "replace")
+
+    def verts_count(self, idx):
+        return int(self.records[idx]["verts_count"])
+
+    def get(self, idx):
+        """
+        Return pattern arrays, the arrays are read-only views of the mapped file
+        :return: (N, 3) float32 array of coordinates and (K, 3) int32 array of triangle vertex indices
+        """
+        record = self.records[idx]
+        co_offset = int(record["co_offset"])
+        faces_offset = int(record["faces_offset"])
+        co = self.data[co_offset:co_offset + int(record["verts_count"]) * 12].view("<f4").reshape(-1, 3)
+        faces = self.data[faces_offset:faces_offset + int(record["faces_count"]) * 12].view("<i4").reshape(-1, 3)
+        return co, faces
+
+
+def write_library(path, patterns):
+    """
+    Create new library file
+    :param patterns: Iterable of (name, coordinates, faces)
+    """
+    with open(path, "wb") as file:
+        file.write(numpy.zeros(1, dtype=HEADER).tobytes())
+    append_library(path, patterns)
+
+
+def append_library(path, patterns):
+    """
+    Append patterns to library file, existing data blocks are not rewritten, only the index
+    :param patterns: Iterable of (name, coordinates, faces)
+    """
+    with open(path, "r+b") as file:
+        header = numpy.frombuffer(file.read(HEADER.itemsize), dtype=HEADER).copy()
+        if header[0]["magic"] == b"":
+            header[0] = (MAGIC, VERSION, 0, HEADER.itemsize)
+        elif header[0]["magic"] != MAGIC or header[0]["version"] != VERSION:
+            raise LibraryException("Not a pattern library '{}'".format(path))
+        offset = int(header[0]["index_offset"])
+        file.seek(offset)
+        records = list(numpy.frombuffer(file.read(int(header[0]["count"]) * RECORD.itemsize), dtype=RECORD))
+
+        file.seek(offset)
+        for name, co, faces in patterns:
+            co = numpy.ascontiguousarray(co, dtype="<f4").reshape(-1, 3)
+            faces = numpy.ascontiguousarray(faces, dtype="<i4").reshape(-1, 3)
+            co_offset = aligned(offset)
+            faces_offset = aligned(co_offset + co.nbytes)
+            file.write(b"\0" * (co_offset - offset) + co.tobytes())
+            file.write(b"\0" * (faces_offset - co_offset - co.nbytes) + faces.tobytes())
+            offset = faces_offset + faces.nbytes
+            records.append(numpy.array((name.encode("utf-8")[:64], co_offset, faces_offset, len(co), len(faces)),
+                                       dtype=RECORD))
+
+        index_offset = aligned(offset)
+        file.write(b"\0" * (index_offset - offset) + numpy.array(records, dtype=RECORD).tobytes())
+        file.truncate()
+        header[0]["count"] = len(records)
+        header[0]["index_offset"] = index_offset
+        file.seek(0)
+        file.write(header.tobytes())
+
+
+libraries = {}
+
+
+def open_library(path):
+    """
+    Return cached library of given path, the file is mapped again when modified
+    :return: PatternLibrary or None if path is empty or not a library
+    """
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (stat.st_mtime, stat.st_size)
+    if path in libraries and libraries[path][0] == key:
+        return libraries[path][1]
+    try:
+        library = PatternLibrary(path)
+    except LibraryException:
+        library = None
+    libraries[path] = (key, library)
+    return library
+
+
+def close_library(path):
+    libraries.pop(path, None)
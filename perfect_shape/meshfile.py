@@ -0,0 +1,280 @@
+import os
+import numpy
+from perfect_shape.core import pack_faces
+
+
+class MeshFileException(Exception):
+    pass
+
+
+class MeshData:
+    """
+    Mesh read from file, faces are packed as in core.pack_faces
+    """
+    def __init__(self, verts, faces, tagged_edges=(), vertex_groups=None):
+        self.verts = numpy.asarray(verts, dtype=numpy.float64).reshape(-1, 3)
+        self.faces = faces
+        self.tagged_edges = numpy.asarray(tagged_edges, dtype=numpy.int64).reshape(-1, 2)
+        self.vertex_groups = vertex_groups or {}
+
+    def get_edges(self):
+        """
+        Return unique edges of faces and tagged edges
+        :return: (E, 2) array of edge vertex indices
+        """
+        polygons_start, polygons_total, loops_vert = self.faces
+        loops_vert = numpy.asarray(loops_vert, dtype=numpy.int64)
+        next_loop = numpy.arange(1, len(loops_vert) + 1)
+        if len(loops_vert):
+            next_loop[numpy.asarray(polygons_start) + numpy.asarray(polygons_total) - 1] = polygons_start
+        edges = numpy.concatenate((numpy.column_stack((loops_vert, loops_vert[next_loop[:len(loops_vert)]])),
+                                   self.tagged_edges))
+        edges.sort(axis=1)
+        return numpy.unique(edges[edges[:, 0] != edges[:, 1]], axis=0)
+
+
+def get_extension(path):
+    return os.path.splitext(path)[1].lower()
+
+
+def read_mesh(path):
+    """
+    Read OBJ, PLY or NPZ mesh
+    :return: MeshData
+    """
+    readers = {".obj": read_obj, ".ply": read_ply, ".npz": read_npz}
+    if get_extension(path) not in readers:
+        raise MeshFileException("Unsupported mesh file '{}'".format(path))
+    return readers[get_extension(path)](path)
+
+
+def write_mesh(path, output_path, verts):
+    """
+    Write mesh with new vertex coordinates, everything else is copied from source file
+    :param path: Source file read with read_mesh
+    :param output_path: Output file, may be the same as source file
+    :param verts: (V, 3) array of vertex coordinates
+    """
+    writers = {".obj": write_obj, ".ply": write_ply, ".npz": write_npz}
+    if get_extension(path) not in writers:
+        raise MeshFileException("Unsupported mesh file '{}'".format(path))
+    temp_path = output_path + ".tmp"
+    writers[get_extension(path)](path, temp_path, numpy.asarray(verts, dtype=numpy.float64).reshape(-1, 3))
+    os.replace(temp_path, output_path)
+
+
+def obj_index(token, count):
+    idx = int(token.split("/")[0])
+    return idx - 1 if idx > 0 else count + idx
+
+
+def read_obj(path):
+    """
+    Read OBJ vertices and faces, polylines ('l' elements) are tagged edges, groups of polylines named
+    with 'g' are also vertex groups
+    """
+    verts = []
+    faces = []
+    tagged_edges = []
+    vertex_groups = {}
+    group = None
+    with open(path, "r") as file:
+        for line in file:
+            tokens = line.split()
+            if not tokens:
+                continue
+            if tokens[0] == "v":
+                verts.append([float(value) for value in tokens[1:4]])
+            elif tokens[0] == "f":
+                faces.append([obj_index(token, len(verts)) for token in tokens[1:]])
+            elif tokens[0] == "l":
+                line_verts = [obj_index(token, len(verts)) for token in tokens[1:]]
+                tagged_edges.extend(zip(line_verts[:-1], line_verts[1:]))
+                if group is not None:
+                    vertex_groups.setdefault(group, set()).update(line_verts)
+            elif tokens[0] == "g":
+                group = " ".join(tokens[1:]) or None
+    vertex_groups = {name: numpy.array(sorted(group_verts), dtype=numpy.int64)
+                     for name, group_verts in vertex_groups.items()}
+    return MeshData(verts, pack_faces(faces), tagged_edges, vertex_groups)
+
+
+def write_obj(path, output_path, verts):
+    """
+    Copy OBJ file line by line, only vertex positions are replaced
+    """
+    idx = 0
+    with open(path, "r") as source, open(output_path, "w") as output:
+        for line in source:
+            tokens = line.split()
+            if tokens and tokens[0] == "v":
+                # Vertex colors and weights following the position are kept
+                output.write(" ".join(["v"] + ["{:.6f}".format(value) for value in verts[idx]] + tokens[4:]) + "\n")
+                idx += 1
+            else:
+                output.write(line)
+
+
+PLY_TYPES = {"char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1", "short": "i2", "int16": "i2",
+             "ushort": "u2", "uint16": "u2", "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+             "float": "f4", "float32": "f4", "double": "f8", "float64": "f8"}
+
+
+def read_ply_header(file):
+    """
+    Parse PLY header
+    :return: tuple of format, list of (element name, count, properties) and header size, properties are
+             (name, type) for scalars and (name, (count type, item type)) for lists
+    """
+    if file.readline().strip() != b"ply":
+        raise MeshFileException("Not a PLY file '{}'".format(file.name))
+    ply_format = None
+    elements = []
+    while True:
+        line = file.readline()
+        if not line:
+            raise MeshFileException("Truncated PLY header '{}'".format(file.name))
+        tokens = line.decode("ascii", "replace").split()
+        if not tokens:
+            continue
+        if tokens[0] == "format":
+            ply_format = tokens[1]
+        elif tokens[0] == "element":
+            elements.append((tokens[1], int(tokens[2]), []))
+        elif tokens[0] == "property":
+            if tokens[1] == "list":
+                elements[-1][2].append((tokens[4], (PLY_TYPES[tokens[2]], PLY_TYPES[tokens[3]])))
+            else:
+                elements[-1][2].append((tokens[2], PLY_TYPES[tokens[1]]))
+        elif tokens[0] == "end_header":
+            break
+    if ply_format not in ("ascii", "binary_little_endian", "binary_big_endian"):
+        raise MeshFileException("Unsupported PLY format '{}'".format(file.name))
+    return ply_format, elements, file.tell()
+
+
+def read_ply_element(file, ply_format, count, properties):
+    """
+    Read PLY element data
+    :return: dictionary of property arrays, list properties are lists of arrays
+    """
+    if ply_format == "ascii":
+        rows = [file.readline().split() for idx in range(count)]
+        values = {}
+        for row in rows:
+            position = 0
+            for name, ply_type in properties:
+                if isinstance(ply_type, tuple):
+                    items_count = int(row[position])
+                    values.setdefault(name, []).append(numpy.array([int(value) for value in
+                                                                    row[position + 1:position + 1 + items_count]]))
+                    position += 1 + items_count
+                else:
+                    values.setdefault(name, []).append(row[position])
+                    position += 1
+        return {name: value if isinstance(dict(properties)[name], tuple) else
+                numpy.array(value, dtype=numpy.float64) for name, value in values.items()}
+
+    order = "<" if ply_format == "binary_little_endian" else ">"
+    if not any(isinstance(ply_type, tuple) for name, ply_type in properties):
+        dtype = numpy.dtype([(name, order + ply_type) for name, ply_type in properties])
+        data = numpy.frombuffer(file.read(dtype.itemsize * count), dtype=dtype)
+        return {name: data[name] for name, ply_type in properties}
+
+    values = {name: [] for name, ply_type in properties}
+    for idx in range(count):
+        for name, ply_type in properties:
+            if isinstance(ply_type, tuple):
+                count_type, item_type = numpy.dtype(order + ply_type[0]), numpy.dtype(order + ply_type[1])
+                items_count = int(numpy.frombuffer(file.read(count_type.itemsize), dtype=count_type)[0])
+                values[name].append(numpy.frombuffer(file.read(item_type.itemsize * items_count), dtype=item_type))
+            else:
+                item_type = numpy.dtype(order + ply_type)
+                values[name].append(numpy.frombuffer(file.read(item_type.itemsize), dtype=item_type)[0])
+    return values
+
+
+def read_ply(path):
+    """
+    Read PLY vertices and faces, 'edge' elements are tagged edges, integer vertex properties other than
+    position, normal, color and texture coordinates are vertex groups (non-zero value means member)
+    """
+    with open(path, "rb") as file:
+        ply_format, elements, header_size = read_ply_header(file)
+        data = {}
+        for name, count, properties in elements:
+            data[name] = read_ply_element(file, ply_format, count, properties)
+
+    vertex = data.get("vertex", {})
+    verts = numpy.column_stack([numpy.asarray(vertex.get(axis, ()), dtype=numpy.float64) for axis in "xyz"])
+    face = data.get("face", {})
+    faces = face.get("vertex_indices", face.get("vertex_index", []))
+    edge = data.get("edge", {})
+    tagged_edges = numpy.column_stack([numpy.asarray(edge.get(name, ()), dtype=numpy.int64)
+                                       for name in ("vertex1", "vertex2")])
+    vertex_groups = {}
+    for name, values in vertex.items():
+        if name in ("x", "y", "z", "nx", "ny", "nz", "red", "green", "blue", "alpha", "s", "t", "u", "v"):
+            continue
+        values = numpy.asarray(values)
+        if numpy.all(values == numpy.round(values)):
+            vertex_groups[name] = numpy.flatnonzero(values)
+    return MeshData(verts, pack_faces([list(face) for face in faces]), tagged_edges, vertex_groups)
+
+
+def write_ply(path, output_path, verts):
+    """
+    Copy PLY file, only vertex positions are replaced
+    """
+    with open(path, "rb") as file:
+        ply_format, elements, header_size = read_ply_header(file)
+        file.seek(0)
+        header = file.read(header_size)
+        body = file.read()
+
+    if elements[0][0] != "vertex":
+        raise MeshFileException("PLY vertex element must be first '{}'".format(path))
+    name, count, properties = elements[0]
+    if ply_format == "ascii":
+        lines = body.split(b"\n")
+        names = [prop_name for prop_name, ply_type in properties]
+        for idx in range(count):
+            tokens = lines[idx].split()
+            for axis, value in zip("xyz", verts[idx]):
+                tokens[names.index(axis)] = "{:.6f}".format(value).encode("ascii")
+            lines[idx] = b" ".join(tokens)
+        body = b"\n".join(lines)
+    else:
+        order = "<" if ply_format == "binary_little_endian" else ">"
+        dtype = numpy.dtype([(prop_name, order + ply_type) for prop_name, ply_type in properties])
+        vertex = numpy.frombuffer(body[:dtype.itemsize * count], dtype=dtype).copy()
+        for axis_idx, axis in enumerate("xyz"):
+            vertex[axis] = verts[:, axis_idx]
+        body = vertex.tobytes() + body[dtype.itemsize * count:]
+
+    with open(output_path, "wb") as file:
+        file.write(header)
+        file.write(body)
+
+
+def read_npz(path):
+    """
+    Read NPZ with 'verts' (V, 3), 'faces_total' and 'faces_verts' arrays, optional 'tagged_edges' (T, 2) and
+    'group_<name>' arrays of vertex indices
+    """
+    with numpy.load(path) as data:
+        polygons_total = data["faces_total"].astype(numpy.int64) if "faces_total" in data else numpy.zeros(0, int)
+        polygons_start = numpy.zeros(len(polygons_total), dtype=numpy.int64)
+        numpy.cumsum(polygons_total[:-1], out=polygons_start[1:])
+        loops_vert = data["faces_verts"].astype(numpy.int64) if "faces_verts" in data else numpy.zeros(0, int)
+        return MeshData(data["verts"], (polygons_start, polygons_total, loops_vert),
+                        data["tagged_edges"] if "tagged_edges" in data else (),
+                        {name[6:]: data[name].astype(numpy.int64) for name in data.files if name.startswith("group_")})
+
+
+def write_npz(path, output_path, verts):
+    with numpy.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    arrays["verts"] = verts.astype(arrays["verts"].dtype)
+    with open(output_path, "wb") as file:
+        numpy.savez(file, **arrays)
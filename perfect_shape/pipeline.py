@@ -0,0 +1,43 @@
+from perfect_shape.cache import get_cache, set_cache, CacheException
+
+
+class StageError(Exception):
+    pass
+
+
+class Stage:
+    """
+    Pipeline stage, its output depends only on declared parameters and outputs of required stages
+    """
+    def __init__(self, name, params=(), requires=()):
+        self.name = name
+        self.params = params
+        self.requires = requires
+
+
+class Pipeline:
+    """
+    Stage graph with memoized outputs, a stage runs again only when its parameters or an upstream stage changed
+    """
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def run(self, owner, params, functions):
+        """
+        Run stages in order, stage outputs must not be modified by the caller
+        :param owner: Cache owner
+        :param params: Dictionary of parameter values
+        :param functions: Dictionary of stage functions, each called with dictionary of upstream outputs
+        :return: Dictionary of stage outputs
+        """
+        outputs = {}
+        tokens = {}
+        for stage in self.stages:
+            inputs = (tuple(params[name] for name in stage.params), tuple(tokens[name] for name in stage.requires))
+            try:
+                outputs[stage.name] = get_cache(owner, stage.name, inputs)
+            except CacheException:
+                outputs[stage.name] = functions[stage.name](outputs)
+                set_cache(owner, stage.name, inputs, outputs[stage.name])
+            tokens[stage.name] = hash(inputs)
+        return outputs
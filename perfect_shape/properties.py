@@ -2,7 +2,15 @@ import bpy
 import bmesh
 from bpy.app.handlers import persistent
 from perfect_shape.shaper import get_loops
-from perfect_shape.utils import get_icon, clear_cache
+from perfect_shape.utils import (get_icon, get_pattern_icon, get_pattern_summary, get_library,
+                                 remove_library_icons)
+from perfect_shape.cache import clear_cache
+from perfect_shape.storage import set_pattern_arrays, migrate_pattern, ensure_pattern_uids
+from perfect_shape import shapes
+
+
+# Scene pattern enum values are their IDs, library patterns are numbered above them
+LIBRARY_OFFSET = 1 << 20
 
 
 def enum_shape_types(self, context):
@@ -10,50 +18,56 @@ def enum_shape_types(self, context):
               ("RECTANGLE", "Rectangle", "Simple rectangle", get_icon("rectangle"), 1),
               ("OBJECT", "Object", "Custom shape from object", get_icon("object"), 2)]
 
-    if len(context.scene.perfect_shape.patterns) > 0:
-        idx = context.scene.perfect_shape.active_pattern
-        pattern = context.scene.perfect_shape.patterns[int(idx)]
-        shapes.append(("PATTERN", pattern.name, "Active 'Perfect Pattern'", get_icon(idx, "patterns"), 3))
+    idx = context.scene.perfect_shape.active_pattern
+    summary = get_pattern_summary(context.scene, idx)
+    if summary is not None:
+        shapes.append(("PATTERN", summary[0], "Active 'Perfect Pattern'", get_pattern_icon(idx, first=True), 3))
     return shapes
 
 
 def enum_patterns(self, context):
     patterns = []
-    for idx, pattern in enumerate(context.scene.perfect_shape.patterns):
-        patterns.append((str(idx), pattern.name, "", get_icon(str(idx), "patterns"), idx))
+    for pattern in context.scene.perfect_shape.patterns:
+        patterns.append((str(pattern.uid), pattern.name, "", get_icon(str(pattern.uid), "patterns"), pattern.uid))
+    library = get_library(context.scene)
+    if library is not None:
+        for idx in range(len(library)):
+            identifier = "L{}".format(idx)
+            patterns.append((identifier, library.name(idx), "Library pattern", get_pattern_icon(identifier),
+                             LIBRARY_OFFSET + idx))
     return patterns
 
 
 def object_update(self, context):
     shape = context.scene.perfect_shape.shape
-    shape.verts.clear()
-    shape.faces.clear()
+    set_pattern_arrays(shape, (), ())
     if self.target in bpy.data.objects:
         object = bpy.data.objects[self.target]
         shape_bm = bmesh.new()
         shape_bm.from_object(object, context.scene)
         loops = get_loops(shape_bm.edges[:])
         if loops and len(loops) == 1:
-            for vert in loops[0][0][0]:
-                item = shape.verts.add()
-                item.co = vert.co
+            shape_co = shapes.from_verts(loops[0][0][0])
             shape_bm.clear()
-            for vert in shape.verts:
-                shape_bm.verts.new(vert.co)
+            for co in shape_co.tolist():
+                shape_bm.verts.new(co)
             shape_bm.verts.ensure_lookup_table()
             verts = shape_bm.verts[:]
             for i in range(len(verts)-1):
                 shape_bm.edges.new((verts[i], verts[i+1 % len(verts)]))
             bmesh.ops.contextual_create(shape_bm, geom=shape_bm.edges)
             bmesh.ops.triangulate(shape_bm, faces=shape_bm.faces)
-            for face in shape_bm.faces:
-                item = shape.faces.add()
-                item.indices = [v.index for v in face.verts]
-            del shape_bm
+            set_pattern_arrays(shape, shape_co, [[v.index for v in face.verts] for face in shape_bm.faces])
+        shape_bm.free()
 
 
 def shape_update(self, context):
-    clear_cache(self.as_pointer())
+    clear_cache(self.as_pointer(), "shapes")
+
+
+def library_update(self, context):
+    remove_library_icons()
+    clear_cache()
 
 
 class PerfectShape:
@@ -94,6 +108,9 @@ class PerfectShape:
     loop_rotation = bpy.props.BoolProperty(name="Loop Rotation", default=False, description="Apply loop rotation")
     shape_rotation = bpy.props.BoolProperty(name="Shape Rotation", default=False,
                                             description="Apply shape rotation")
+    fit_rotation = bpy.props.BoolProperty(name="Fit Rotation", default=False,
+                                          description="Rotate shape to minimize vertices displacement, "
+                                                      "replaces loop and shape rotation")
 
     shape_translation = bpy.props.FloatVectorProperty(name="Translation", subtype="XYZ", precision=4,
                                                       description="Additional shape translation")
@@ -116,6 +133,8 @@ class PerfectShape:
                                          description="Additional side inset loop")
     offset = bpy.props.FloatProperty(name="Offset", precision=3, description="Changes shape size")
     shift = bpy.props.IntProperty(name="Shift", description="Changes the order of vertices for the given number")
+    reverse_correspondence = bpy.props.BoolProperty(name="Reversed Order", default=False,
+                                                    description="Allow matching loop vertices in reversed order")
     rotation = bpy.props.FloatProperty(name="Rotation", subtype="ANGLE", default=0, precision=3,
                                        description="Additional shape rotation")
     span = bpy.props.IntProperty(name="Span", min=0, update=shape_update, description="Additional circle segments")
@@ -142,6 +161,12 @@ class Face(bpy.types.PropertyGroup):
 
 class PerfectPattern(bpy.types.PropertyGroup):
     name = bpy.props.StringProperty(default="Pattern")
+    uid = bpy.props.IntProperty(options={"HIDDEN"})
+    co_data = bpy.props.StringProperty(options={"HIDDEN"}, description="Packed float32 vertex coordinates")
+    faces_data = bpy.props.StringProperty(options={"HIDDEN"}, description="Packed int32 triangle indices")
+    verts_count = bpy.props.IntProperty(options={"HIDDEN"})
+    is_packed = bpy.props.BoolProperty(options={"HIDDEN"}, default=False)
+    # Storage of files saved before packed arrays, kept only for migration
     verts = bpy.props.CollectionProperty(type=Vert)
     faces = bpy.props.CollectionProperty(type=Face)
 
@@ -154,17 +179,75 @@ class PerfectShapeProperties(bpy.types.PropertyGroup):
 
     active_pattern = bpy.props.EnumProperty(name="Active Pattern", items=enum_patterns)
     patterns = bpy.props.CollectionProperty(type=PerfectPattern)
+    last_pattern_uid = bpy.props.IntProperty(options={"HIDDEN"})
+    library_path = bpy.props.StringProperty(name="Pattern Library", subtype="FILE_PATH", update=library_update,
+                                            description="Pattern library file shared between .blend files")
+
+
+object_index = {}
+
+
+def get_names_hash():
+    """
+    Return hash of all object names, read without iterating over objects in Python
+    """
+    return hash(tuple(bpy.data.objects.keys()))
+
+
+def is_object_index_valid(scene, index):
+    """
+    Cheap check if mesh objects index may be out of date, renames are found by hash of object names
+    """
+    if index is None:
+        return False
+    objects_count, names_hash, names = index
+    if objects_count != len(bpy.data.objects) or len(names) != len(scene.perfect_shape.objects):
+        return False
+    if names_hash != get_names_hash():
+        return False
+    active = scene.objects.active
+    return active is None or (active.type == "MESH") == (active.name in names)
+
+
+def update_object_index(scene):
+    """
+    Synchronize scene mesh objects collection in place, only added, removed and renamed items are touched
+    """
+    items = scene.perfect_shape.objects
+    index = object_index.get(scene.as_pointer())
+    old_names = index[2] if index is not None and len(index[2]) == len(items) else {item.name for item in items}
+    names = {object.name for object in bpy.data.objects if object.type == "MESH"}
+
+    removed = old_names - names
+    if removed:
+        for idx in sorted((items.find(name) for name in removed), reverse=True):
+            if idx >= 0:
+                items.remove(idx)
+    for name in names - old_names:
+        item = items.add()
+        item.name = name
+    object_index[scene.as_pointer()] = (len(bpy.data.objects), get_names_hash(), names)
 
 
 @persistent
 def handler(scene):
     if bpy.data.objects.is_updated:
-        ps = scene.perfect_shape
-        ps.objects.clear()
-        for object in bpy.data.objects:
-            if object.type == "MESH":
-                item = ps.objects.add()
-                item.name = object.name
+        if not is_object_index_valid(scene, object_index.get(scene.as_pointer())):
+            update_object_index(scene)
+
+
+def migrate_scenes():
+    for scene in bpy.data.scenes:
+        ensure_pattern_uids(scene.perfect_shape)
+        migrate_pattern(scene.perfect_shape.shape)
+        for pattern in scene.perfect_shape.patterns:
+            migrate_pattern(pattern)
+
+
+@persistent
+def load_handler(scene):
+    object_index.clear()
+    migrate_scenes()
 
 
 def register():
@@ -174,6 +257,10 @@ def register():
     bpy.utils.register_class(PerfectShapeProperties)
     bpy.types.Scene.perfect_shape = bpy.props.PointerProperty(type=PerfectShapeProperties)
     bpy.app.handlers.scene_update_pre.append(handler)
+    bpy.app.handlers.load_post.append(load_handler)
+    # Addon enabled in already open file, data is restricted during startup and migrated by load_post then
+    if isinstance(bpy.data, bpy.types.BlendData):
+        migrate_scenes()
 
 
 def unregister():
@@ -183,3 +270,4 @@ def unregister():
     bpy.utils.unregister_class(PerfectPattern)
     bpy.utils.unregister_class(PerfectShapeProperties)
     bpy.app.handlers.scene_update_pre.remove(handler)
+    bpy.app.handlers.load_post.remove(load_handler)
@@ -0,0 +1,130 @@
+import numpy
+
+
+def pixel_centers(size):
+    """
+    Return pixel centers in normalized device coordinates, first row is bottom image row
+    :param size: Image width and height in pixels
+    :return: (size * size, 2) array of coordinates
+    """
+    axis = (numpy.arange(size) + 0.5) / size * 2.0 - 1.0
+    xs, ys = numpy.meshgrid(axis, axis)
+    return numpy.column_stack((xs.ravel(), ys.ravel()))
+
+
+def fill_polygon(points, verts):
+    """
+    Even-odd polygon coverage of points
+    :param points: (N, 2) array of coordinates
+    :param verts: (M, 2) array of polygon vertices
+    :return: (N,) bool mask
+    """
+    inside = numpy.zeros(len(points), dtype=bool)
+    x, y = points[:, 0], points[:, 1]
+    for (x0, y0), (x1, y1) in zip(verts.tolist(), numpy.roll(verts, -1, axis=0).tolist()):
+        if y0 == y1:
+            continue
+        crossing = (y0 > y) != (y1 > y)
+        inside ^= crossing & (x < x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+    return inside
+
+
+def fill_triangles(points, verts, faces, size):
+    """
+    Triangles coverage of points, each triangle is tested only over its bounding box
+    :param points: (size * size, 2) array of pixel centers
+    :param verts: (M, 2) array of vertices
+    :param faces: (K, 3) array of triangle vertex indices
+    :return: (size * size,) bool mask
+    """
+    inside = numpy.zeros(len(points), dtype=bool).reshape(size, size)
+    grid = points.reshape(size, size, 2)
+    for triangle in verts[numpy.asarray(faces, dtype=numpy.int64).reshape(-1, 3)]:
+        col_min, row_min = numpy.clip(((triangle.min(axis=0) + 1) / 2 * size).astype(int), 0, size)
+        col_max, row_max = numpy.clip(((triangle.max(axis=0) + 1) / 2 * size).astype(int) + 1, 0, size)
+        if col_min >= col_max or row_min >= row_max:
+            continue
+        block = grid[row_min:row_max, col_min:col_max]
+        (ax, ay), (bx, by), (cx, cy) = triangle.tolist()
+        area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        if area == 0:
+            continue
+        px, py = block[..., 0], block[..., 1]
+        w0 = ((bx - px) * (cy - py) - (by - py) * (cx - px)) / area
+        w1 = ((cx - px) * (ay - py) - (cy - py) * (ax - px)) / area
+        inside[row_min:row_max, col_min:col_max] |= (w0 >= -1e-9) & (w1 >= -1e-9) & (w0 + w1 <= 1 + 1e-9)
+    return inside.ravel()
+
+
+def segments_distance(points, starts, ends, size, padding):
+    """
+    Return distance in pixels from each pixel center to the nearest segment, each segment is measured only over its
+    bounding box grown by padding, other pixels are infinitely far
+    :param points: (size * size, 2) array of pixel centers
+    :param starts: (M, 2) array of segment starts
+    :param ends: (M, 2) array of segment ends
+    :param padding: Distance in pixels beyond which pixels are not measured
+    :return: (size * size,) array of distances
+    """
+    distance = numpy.full((size, size), numpy.inf)
+    grid = points.reshape(size, size, 2)
+    pixel = 2.0 / size
+    lows = numpy.clip(numpy.floor((numpy.minimum(starts, ends) + 1) / 2 * size - padding), 0, size).astype(int)
+    highs = numpy.clip(numpy.floor((numpy.maximum(starts, ends) + 1) / 2 * size + padding) + 1, 0, size).astype(int)
+    for (ax, ay), (bx, by), (col_min, row_min), (col_max, row_max) in zip(starts.tolist(), ends.tolist(),
+                                                                          lows.tolist(), highs.tolist()):
+        if col_min >= col_max or row_min >= row_max:
+            continue
+        block = grid[row_min:row_max, col_min:col_max]
+        px, py = block[..., 0] - ax, block[..., 1] - ay
+        abx, aby = bx - ax, by - ay
+        t = numpy.clip((px * abx + py * aby) / max(abx * abx + aby * aby, 1e-12), 0.0, 1.0)
+        dx, dy = px - t * abx, py - t * aby
+        view = distance[row_min:row_max, col_min:col_max]
+        numpy.minimum(view, numpy.sqrt(dx * dx + dy * dy) / pixel, out=view)
+    return distance.ravel()
+
+
+def blend(image, color, coverage):
+    """
+    Blend color over image with per pixel coverage
+    """
+    coverage = coverage[:, None]
+    image[:, :3] = image[:, :3] * (1.0 - coverage) + numpy.asarray(color[:3], dtype=numpy.float32) * coverage
+
+
+def render_icon(verts, faces, polygon_color, edge_color, vertex_color, clear_color, size=200,
+                line_width=4.0, point_size=10.0):
+    """
+    Render shape preview without GL
+    :param verts: Shape outline vertices in -1..1 range
+    :param faces: Triangles vertex indices, if None outline is filled as polygon
+    :param size: Image width and height in pixels
+    :param line_width: Outline width in pixels
+    :param point_size: Vertex marker diameter in pixels
+    :return: Flat RGBA float32 array, bottom row first, background alpha keyed out
+    """
+    verts = numpy.asarray(verts, dtype=numpy.float64).reshape(-1, 2)
+    points = pixel_centers(size)
+
+    image = numpy.empty((size * size, 4), dtype=numpy.float32)
+    image[:] = numpy.asarray(tuple(clear_color[:3]) + (1.0,), dtype=numpy.float32)
+    if len(verts) == 0:
+        image[:, 3] = 0.0
+        return image.ravel()
+
+    if faces is None:
+        filled = fill_polygon(points, verts)
+    else:
+        filled = fill_triangles(points, verts, faces, size)
+    blend(image, polygon_color, filled.astype(numpy.float32))
+
+    distance = segments_distance(points, verts, numpy.roll(verts, -1, axis=0), size, line_width / 2 + 1)
+    blend(image, edge_color, numpy.clip(line_width / 2 + 0.5 - distance, 0.0, 1.0))
+
+    distance = segments_distance(points, verts, verts, size, point_size / 2 + 1)
+    blend(image, vertex_color, numpy.clip(point_size / 2 + 0.5 - distance, 0.0, 1.0))
+
+    keyed = numpy.all(image[:, :3] == numpy.asarray(clear_color[:3], dtype=numpy.float32), axis=1)
+    image[keyed, 3] = 0.0
+    return image.ravel()
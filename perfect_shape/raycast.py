@@ -0,0 +1,210 @@
+import numpy
+
+
+class BVHTreeRayCaster:
+    """
+    Batched ray casting on top of mathutils.bvhtree.BVHTree
+    """
+    def __init__(self, bvh):
+        self.bvh = bvh
+
+    def ray_cast(self, origins, directions):
+        """
+        Cast rays and return first hits
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of ray directions
+        :return: tuple of (N, 3) hit positions (origins on miss) and (N,) hit mask
+        """
+        positions = numpy.array(origins, dtype=numpy.float64)
+        mask = numpy.zeros(len(positions), dtype=bool)
+        ray_cast = self.bvh.ray_cast
+        for idx, (origin, direction) in enumerate(zip(positions.tolist(), numpy.asarray(directions).tolist())):
+            location = ray_cast(origin, direction)[0]
+            if location is not None:
+                positions[idx] = location
+                mask[idx] = True
+        return positions, mask
+
+
+class TriangleBVH:
+    """
+    Bounding volume hierarchy over triangles with batched ray casting, usable without Blender
+    """
+    leaf_size = 8
+
+    def __init__(self, verts, triangles):
+        verts = numpy.asarray(verts, dtype=numpy.float64).reshape(-1, 3)
+        triangles = numpy.asarray(triangles, dtype=numpy.int64).reshape(-1, 3)
+        triangles_co = verts[triangles]
+        self.v0 = triangles_co[:, 0]
+        self.e1 = triangles_co[:, 1] - self.v0
+        self.e2 = triangles_co[:, 2] - self.v0
+
+        lows = triangles_co.min(axis=1)
+        highs = triangles_co.max(axis=1)
+        centroids = triangles_co.mean(axis=1)
+
+        self.order = numpy.arange(len(triangles))
+        nodes_min = []
+        nodes_max = []
+        nodes_children = []
+        nodes_range = []
+
+        def new_node(start, end):
+            nodes_min.append(lows[self.order[start:end]].min(axis=0) if end > start else numpy.zeros(3))
+            nodes_max.append(highs[self.order[start:end]].max(axis=0) if end > start else -numpy.ones(3))
+            nodes_children.append((-1, -1))
+            nodes_range.append((start, end - start))
+            return len(nodes_range) - 1
+
+        stack = [(new_node(0, len(triangles)), 0, len(triangles))]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= self.leaf_size:
+                continue
+            items = self.order[start:end]
+            items_centroids = centroids[items]
+            axis = numpy.argmax(items_centroids.max(axis=0) - items_centroids.min(axis=0))
+            middle = (end - start) // 2
+            self.order[start:end] = items[numpy.argpartition(items_centroids[:, axis], middle)]
+            left = new_node(start, start + middle)
+            right = new_node(start + middle, end)
+            nodes_children[node] = (left, right)
+            stack.append((left, start, start + middle))
+            stack.append((right, start + middle, end))
+
+        self.nodes_min = numpy.array(nodes_min).reshape(-1, 3)
+        self.nodes_max = numpy.array(nodes_max).reshape(-1, 3)
+        self.nodes_children = numpy.array(nodes_children, dtype=numpy.int64).reshape(-1, 2)
+        self.nodes_range = numpy.array(nodes_range, dtype=numpy.int64).reshape(-1, 2)
+
+    def intersect(self, origins, directions, triangles):
+        """
+        Double sided ray-triangle intersection of ray and triangle pairs
+        :return: (N,) array of hit distances along directions, inf on miss
+        """
+        e1 = self.e1[triangles]
+        e2 = self.e2[triangles]
+        pvec = numpy.cross(directions, e2)
+        det = numpy.einsum("ij,ij->i", e1, pvec)
+        valid = numpy.abs(det) > 1e-12
+        inv_det = numpy.where(valid, 1.0, 0.0) / numpy.where(valid, det, 1.0)
+        tvec = origins - self.v0[triangles]
+        u = numpy.einsum("ij,ij->i", tvec, pvec) * inv_det
+        qvec = numpy.cross(tvec, e1)
+        v = numpy.einsum("ij,ij->i", directions, qvec) * inv_det
+        t = numpy.einsum("ij,ij->i", e2, qvec) * inv_det
+        valid &= (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+        return numpy.where(valid, t, numpy.inf)
+
+    def ray_cast(self, origins, directions):
+        """
+        Cast rays and return first hits, all rays traverse the tree together
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of ray directions
+        :return: tuple of (N, 3) hit positions (origins on miss) and (N,) hit mask
+        """
+        origins = numpy.asarray(origins, dtype=numpy.float64).reshape(-1, 3)
+        directions = numpy.asarray(directions, dtype=numpy.float64).reshape(-1, 3)
+        distances = numpy.full(len(origins), numpy.inf)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            inv_directions = 1.0 / directions
+
+            rays = numpy.arange(len(origins))
+            nodes = numpy.zeros(len(origins), dtype=numpy.int64)
+            while rays.size:
+                t0 = (self.nodes_min[nodes] - origins[rays]) * inv_directions[rays]
+                t1 = (self.nodes_max[nodes] - origins[rays]) * inv_directions[rays]
+                t_near = numpy.fmax.reduce(numpy.fmin(t0, t1), axis=1)
+                t_far = numpy.fmin.reduce(numpy.fmax(t0, t1), axis=1)
+                hit = (t_far >= numpy.maximum(t_near, 0)) & (t_near <= distances[rays])
+                rays = rays[hit]
+                nodes = nodes[hit]
+
+                is_leaf = self.nodes_children[nodes, 0] < 0
+                leaf_rays = rays[is_leaf]
+                if leaf_rays.size:
+                    starts, counts = self.nodes_range[nodes[is_leaf]].T
+                    pair_rays = numpy.repeat(leaf_rays, counts)
+                    offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+                    pair_triangles = self.order[numpy.repeat(starts, counts) + offsets]
+                    t = self.intersect(origins[pair_rays], directions[pair_rays], pair_triangles)
+                    numpy.minimum.at(distances, pair_rays, t)
+
+                inner_nodes = nodes[~is_leaf]
+                rays = numpy.concatenate((rays[~is_leaf], rays[~is_leaf]))
+                nodes = numpy.concatenate((self.nodes_children[inner_nodes, 0], self.nodes_children[inner_nodes, 1]))
+
+        mask = numpy.isfinite(distances)
+        positions = origins.copy()
+        positions[mask] += directions[mask] * distances[mask, None]
+        return positions, mask
+
+
+def wrap(ray_caster, origins, directions):
+    """
+    Wrap points to surface, casting along directions first and backwards for missed points
+    :param ray_caster: Object with batched ray_cast(origins, directions) method
+    :param origins: (N, 3) array of points
+    :param directions: (N, 3) array of cast directions
+    :return: tuple of (N, 3) wrapped positions (unchanged points on miss) and (N,) hit mask
+    """
+    origins = numpy.asarray(origins, dtype=numpy.float64).reshape(-1, 3)
+    directions = numpy.asarray(directions, dtype=numpy.float64).reshape(-1, 3)
+    positions, mask = ray_caster.ray_cast(origins, directions)
+    missed = numpy.flatnonzero(~mask)
+    if missed.size:
+        back_positions, back_mask = ray_caster.ray_cast(origins[missed], -directions[missed])
+        positions[missed[back_mask]] = back_positions[back_mask]
+        mask[missed] = back_mask
+    return positions, mask
+
+
+def padded_bounds(coords, padding=1.0):
+    """
+    Return bounding box of coordinates grown by its largest dimension times padding
+    :param coords: (N, 3) array of coordinates
+    :param padding: Relative padding
+    :return: tuple of box minimum and maximum
+    """
+    bounds_min = coords.min(axis=0)
+    bounds_max = coords.max(axis=0)
+    pad = max((bounds_max - bounds_min).max() * padding, 1e-4)
+    return bounds_min - pad, bounds_max + pad
+
+
+def region_mesh(verts_co, polygons_start, polygons_total, loops_vert, bounds_min, bounds_max):
+    """
+    Return part of the mesh with polygons overlapping bounding box
+    :param verts_co: (N, 3) array of vertex coordinates
+    :param polygons_start: Polygons first loop indices
+    :param polygons_total: Polygons loop counts
+    :param loops_vert: Loops vertex indices
+    :return: tuple of (M, 3) array of region vertex coordinates and list of region polygons vertex indices
+    """
+    if len(polygons_start) == 0:
+        return numpy.zeros((0, 3)), []
+    loops_co = verts_co[loops_vert]
+    polygons_min = numpy.minimum.reduceat(loops_co, polygons_start, axis=0)
+    polygons_max = numpy.maximum.reduceat(loops_co, polygons_start, axis=0)
+    inside = numpy.all((polygons_max >= bounds_min) & (polygons_min <= bounds_max), axis=1)
+
+    region_loops = loops_vert[numpy.repeat(inside, polygons_total)]
+    region_verts, region_loops = numpy.unique(region_loops, return_inverse=True)
+    polygons = numpy.split(region_loops, numpy.cumsum(polygons_total[inside])[:-1])
+    return verts_co[region_verts], [polygon.tolist() for polygon in polygons]
+
+
+def fan_triangles(polygons_start, polygons_total, loops_vert):
+    """
+    Triangulate polygons as fans around their first vertex
+    :param polygons_start: Polygons first loop indices
+    :param polygons_total: Polygons loop counts
+    :param loops_vert: Loops vertex indices
+    :return: (K, 3) array of triangle vertex indices
+    """
+    loops_vert = numpy.asarray(loops_vert)
+    counts = numpy.maximum(numpy.asarray(polygons_total) - 2, 0)
+    first = numpy.repeat(polygons_start, counts)
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return numpy.column_stack((loops_vert[first], loops_vert[first + offsets + 1], loops_vert[first + offsets + 2]))
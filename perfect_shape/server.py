@@ -0,0 +1,270 @@
+"""
+Local job server reshaping loops of meshes sent by other tools, runs without Blender.
+
+Messages are a JSON header line followed by 'size' bytes of payload. A job request is
+{"id": ..., "params": {...}, "group": name or null, "timeout": seconds} with mesh in NPZ format (see meshfile.read_npz)
+as payload. The server answers {"id": ..., "status": "accepted"} when the job is queued and later "done" with the
+reshaped NPZ as payload, "error" or "timeout". Answers of jobs of one connection come in order of completion.
+
+At most max_pending jobs are queued or running, further requests are not read until a job finishes, so clients are
+slowed down by the socket instead of filling server memory. Jobs answered by timeout hold their slot until their
+worker finishes them.
+
+    python -m perfect_shape.server --socket /tmp/perfect_shape.sock
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from perfect_shape import core
+from perfect_shape.batch import reshape_mesh
+from perfect_shape.meshfile import read_npz
+from perfect_shape.pipeline import StageError
+
+MAX_PAYLOAD = 512 * 1024 * 1024
+
+
+class ProtocolException(Exception):
+    pass
+
+
+async def read_message(reader, max_payload=MAX_PAYLOAD):
+    """
+    Read message from stream
+    :return: tuple of header dictionary and payload bytes, None at end of stream
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        header = json.loads(line.decode("utf-8"))
+    except ValueError:
+        raise ProtocolException("Invalid message header")
+    if not isinstance(header, dict):
+        raise ProtocolException("Invalid message header")
+    size = header.get("size", 0)
+    if not isinstance(size, int) or size < 0 or size > max_payload:
+        raise ProtocolException("Invalid payload size")
+    return header, await reader.readexactly(size)
+
+
+def write_message(writer, header, payload=b""):
+    header = dict(header, size=len(payload))
+    writer.write(json.dumps(header).encode("utf-8") + b"\n" + payload)
+
+
+def pack_mesh(verts, faces=(), tagged_edges=(), vertex_groups=None):
+    """
+    Return mesh as NPZ payload
+    :param faces: Sequence of face vertex indices sequences
+    :param tagged_edges: (T, 2) array of edge vertex indices
+    :param vertex_groups: Dictionary of vertex group names and vertex indices
+    """
+    polygons_start, polygons_total, loops_vert = core.pack_faces(faces)
+    arrays = {"verts": numpy.asarray(verts, dtype=numpy.float64).reshape(-1, 3), "faces_total": polygons_total,
+              "faces_verts": loops_vert,
+              "tagged_edges": numpy.asarray(tagged_edges, dtype=numpy.int64).reshape(-1, 2)}
+    for name, indices in (vertex_groups or {}).items():
+        arrays["group_" + name] = numpy.asarray(indices, dtype=numpy.int64)
+    output = io.BytesIO()
+    numpy.savez(output, **arrays)
+    return output.getvalue()
+
+
+def unpack_verts(payload):
+    """
+    Return vertex coordinates of NPZ payload
+    """
+    with numpy.load(io.BytesIO(payload)) as data:
+        return data["verts"]
+
+
+def get_params(params):
+    """
+    Return reshape parameters of job, unknown names and invalid values are rejected
+    """
+    if not isinstance(params, dict):
+        raise ProtocolException("Invalid parameters")
+    unknown = set(params) - set(core.DEFAULT_PARAMS)
+    if unknown:
+        raise ProtocolException("Unknown parameters: {}".format(", ".join(sorted(unknown))))
+    try:
+        core.check_params(params)
+    except StageError as e:
+        raise ProtocolException(str(e))
+    params = dict(params)
+    if params.get("shape_co") is not None:
+        params["shape_co"] = numpy.asarray(params["shape_co"], dtype=numpy.float64).reshape(-1, 3)
+    return params
+
+
+def process_job(payload, params, group):
+    """
+    Reshape mesh of job payload, runs in worker process
+    :return: tuple of reshaped NPZ payload, number of reshaped loops and warnings
+    """
+    mesh = read_npz(io.BytesIO(payload))
+    verts, edits, warnings = reshape_mesh(mesh, params, group)
+    with numpy.load(io.BytesIO(payload)) as data:
+        arrays = {name: data[name] for name in data.files}
+    arrays["verts"] = verts.astype(arrays["verts"].dtype)
+    output = io.BytesIO()
+    numpy.savez(output, **arrays)
+    return output.getvalue(), len(edits), warnings
+
+
+class JobServer:
+    """
+    Asyncio server scheduling reshape jobs over a pool of worker processes
+    """
+    def __init__(self, workers=None, max_pending=16, timeout=60.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.executor = ProcessPoolExecutor(workers)
+        self.slots = None
+        self.server = None
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """
+        Listen on Unix socket path, or on local TCP port if path is None
+        :return: Bound address, socket path or (host, port)
+        """
+        self.slots = asyncio.Semaphore(self.max_pending)
+        if path is not None:
+            if os.path.exists(path):
+                os.remove(path)
+            self.server = await asyncio.start_unix_server(self.handle, path=path, limit=1024 * 1024)
+            return path
+        self.server = await asyncio.start_server(self.handle, host=host, port=port, limit=1024 * 1024)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        jobs = set()
+        try:
+            while True:
+                # Backpressure, next request is read only when a queue slot is free
+                await self.slots.acquire()
+                try:
+                    message = await read_message(reader)
+                except (ProtocolException, asyncio.IncompleteReadError, ValueError) as e:
+                    self.slots.release()
+                    write_message(writer, {"status": "error", "error": str(e) or "Incomplete message"})
+                    break
+                if message is None:
+                    self.slots.release()
+                    break
+                job = asyncio.ensure_future(self.run_job(writer, *message))
+                jobs.add(job)
+                job.add_done_callback(jobs.discard)
+            if jobs:
+                await asyncio.gather(*jobs, return_exceptions=True)
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # Client went away or server is closing, connection ends without raising into the stream callback
+            for job in jobs:
+                job.cancel()
+        finally:
+            writer.close()
+
+    def submit(self, executor, *args):
+        """
+        Submit job to executor, its queue slot is released only when the job is finished in worker process, also
+        when it was answered by timeout before
+        :return: concurrent.futures.Future
+        """
+        loop = asyncio.get_running_loop()
+
+        def release(future):
+            try:
+                loop.call_soon_threadsafe(self.slots.release)
+            except RuntimeError:
+                # Loop is closed, server is shutting down
+                pass
+
+        try:
+            future = executor.submit(process_job, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(release)
+        return future
+
+    def replace_executor(self, executor):
+        """
+        Replace broken executor, jobs failed by the same broken executor replace it only once
+        """
+        if self.executor is executor:
+            self.executor = ProcessPoolExecutor(self.workers)
+            executor.shutdown(wait=False)
+
+    async def run_job(self, writer, header, payload):
+        job_id = header.get("id")
+        try:
+            params = get_params(header.get("params", {}))
+            timeout = float(header.get("timeout") or self.timeout)
+        except (ProtocolException, TypeError, ValueError) as e:
+            self.slots.release()
+            write_message(writer, {"id": job_id, "status": "error", "error": str(e)})
+            return
+        write_message(writer, {"id": job_id, "status": "accepted"})
+        executor = self.executor
+        try:
+            future = self.submit(executor, payload, params, header.get("group"))
+            # A job still running after timeout can't be interrupted, its result is discarded
+            result, loops_count, warnings = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            write_message(writer, {"id": job_id, "status": "timeout"})
+        except BrokenProcessPool:
+            self.replace_executor(executor)
+            write_message(writer, {"id": job_id, "status": "error", "error": "Worker process failed"})
+        except Exception as e:
+            # Any failure of a job is answered, client would wait for it forever otherwise
+            write_message(writer, {"id": job_id, "status": "error", "error": str(e) or e.__class__.__name__})
+        else:
+            write_message(writer, {"id": job_id, "status": "done", "loops": loops_count,
+                                   "warnings": warnings}, result)
+        await writer.drain()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m perfect_shape.server", description="Local reshape job server.")
+    parser.add_argument("--socket", help="Unix socket path")
+    parser.add_argument("--port", type=int, default=8765, help="Local TCP port, used if socket is not set")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--max-pending", type=int, default=16, help="Number of queued jobs")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Default job timeout in seconds")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    server = JobServer(args.jobs, args.max_pending, args.timeout)
+    address = await server.start(path=args.socket, port=args.port)
+    print("Listening on {}".format(address), flush=True)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    try:
+        asyncio.run(serve(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
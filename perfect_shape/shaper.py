@@ -1,69 +1,125 @@
-from functools import reduce
-from operator import add
-from mathutils import Vector, Matrix
-import math
-
-
-def get_loop(edges, vert=None):
-    if vert is None:
-        edge = edges[0]
-        edges.remove(edge)
-        success_0, is_boundary_0, verts_0, edges_0 = get_loop(edges, edge.verts[0])
-        success_1, is_boundary_1, verts_1, edges_1 = get_loop(edges, edge.verts[1])
-        if len(verts_0) > 0:
-            edges_0.reverse()
-            verts_0.reverse()
-            verts_0 = verts_0 + [v for v in edge.verts if v not in verts_0]
-        if len(verts_1) > 0:
-            if len(verts_0) == 0:
-                verts_1 = verts_1 + [v for v in edge.verts if v not in verts_1]
-        is_boundary = is_boundary_0 and is_boundary_1
-        success = success_0 and success_1
-        if edge.is_boundary:
-            is_boundary = True
-        return success, is_boundary, verts_0 + verts_1, edges_0 + [edge] + edges_1
-
-    link_edges = [e for e in vert.link_edges if e in edges]
-
-    if len(link_edges) == 1:
-        edge = link_edges[0]
-        vert, = set(edge.verts) - {vert}
-        edges.remove(edge)
-        success, is_boundary, verts_, edges_ = get_loop(edges, vert)
-        if edge.is_boundary:
-            is_boundary = True
-        return success, is_boundary, [vert] + verts_, [edge] + edges_
-
-    elif len(link_edges) > 1:
-        for edge in link_edges:
-            edges.remove(edge)
-        return False, False, [], []
-
-    return True, False, [], []
+import numpy
+
+
+def get_adjacency(edge_verts, verts_count):
+    """
+    Build vertex to edge adjacency in CSR form
+    :param edge_verts: Flat sequence of edge vertex indices, two per edge
+    :param verts_count: Number of vertices
+    :return: tuple of offsets and edge indices, edges linked to vertex i are edges[offsets[i]:offsets[i + 1]]
+    """
+    edge_verts = numpy.asarray(edge_verts, dtype=numpy.int32).reshape(-1)
+    offsets = numpy.zeros(verts_count + 1, dtype=numpy.int32)
+    numpy.cumsum(numpy.bincount(edge_verts, minlength=verts_count), out=offsets[1:])
+    link_edges = numpy.argsort(edge_verts, kind="mergesort") // 2
+    return offsets.tolist(), link_edges.tolist()
+
+
+def walk_loops(edge_verts, verts_count):
+    """
+    Split indexed edges into vertex-ordered chains
+    :param edge_verts: Flat sequence of edge vertex indices, two per edge
+    :param verts_count: Number of vertices
+    :return: list of (success, is_cyclic, verts, edges) tuples, edge i of a chain joins verts i and i + 1
+    """
+    edge_verts = list(edge_verts)
+    offsets, link_edges = get_adjacency(edge_verts, verts_count)
+    used = [False] * (len(edge_verts) // 2)
+    loops = []
+
+    for start in range(len(used)):
+        if used[start]:
+            continue
+        used[start] = True
+        success = True
+        walks = []
+        for side in (0, 1):
+            vert = edge_verts[start * 2 + side]
+            walk_verts = []
+            walk_edges = []
+            while True:
+                links = [e for e in link_edges[offsets[vert]:offsets[vert + 1]] if not used[e]]
+                if len(links) > 1:
+                    for edge in links:
+                        used[edge] = True
+                    success = False
+                if len(links) != 1:
+                    break
+                edge = links[0]
+                used[edge] = True
+                vert = edge_verts[edge * 2 + 1] if edge_verts[edge * 2] == vert else edge_verts[edge * 2]
+                walk_verts.append(vert)
+                walk_edges.append(edge)
+            walks.append((walk_verts, walk_edges))
+
+        (verts_0, edges_0), (verts_1, edges_1) = walks
+        verts_0.reverse()
+        edges_0.reverse()
+        is_cyclic = len(verts_0) > 0 and verts_0[0] == edge_verts[start * 2 + 1]
+        if is_cyclic:
+            loops.append((success, True, verts_0 + [edge_verts[start * 2]], edges_0 + [start]))
+        else:
+            loops.append((success, False, verts_0 + edge_verts[start * 2:start * 2 + 2] + verts_1,
+                          edges_0 + [start] + edges_1))
+    return loops
+
+
+def get_edge_loops(edges):
+    """
+    Split BMesh edges into vertex-ordered loops
+    :param edges: BMesh edges
+    :return: list of (success, is_cyclic, is_boundary, verts, edges) tuples
+    """
+    edges = [e for e in edges]
+    verts = []
+    verts_index = {}
+    edge_verts = []
+    for edge in edges:
+        for vert in edge.verts:
+            idx = verts_index.get(vert)
+            if idx is None:
+                idx = verts_index[vert] = len(verts)
+                verts.append(vert)
+            edge_verts.append(idx)
+
+    loops = []
+    for success, is_cyclic, loop_verts, loop_edges in walk_loops(edge_verts, len(verts)):
+        loop_edges = [edges[e] for e in loop_edges]
+        is_boundary = any(e.is_boundary for e in loop_edges)
+        loops.append((success, is_cyclic, is_boundary, [verts[v] for v in loop_verts], loop_edges))
+    return loops
+
+
+def write_verts(verts, indices, verts_co):
+    """
+    Write new coordinates to BMesh vertices
+    :param verts: BMesh vertex sequence with lookup table
+    :param indices: Vertex indices
+    :param verts_co: (N, 3) array of their new coordinates
+    """
+    # BMesh has no bulk setter and Mesh.vertices.foreach_set is overwritten by the edit-mode BMesh, a single pass
+    # over precomputed tuples is the cheapest write
+    for idx, co in zip(indices.tolist(), verts_co.tolist()):
+        verts[idx].co = co
 
 
 def get_loops(edges, faces=None):
-    edges = edges[:]
     loops = []
 
     if faces:
-        for group in get_boundary_edges(faces[:]):
-            success, is_boundary, loop_verts, loop_edges = get_loop(group[0])
-            is_cyclic = any((v for v in loop_edges[0].verts if v in loop_edges[-1].verts))
-            loops.append(((loop_verts, loop_edges, group[1]), is_cyclic, is_boundary))
+        for group_edges, group_faces in get_boundary_edges(faces):
+            if not group_edges:
+                continue
+            success, is_cyclic, is_boundary, loop_verts, loop_edges = get_edge_loops(group_edges)[0]
+            loops.append(((loop_verts, loop_edges, group_faces), is_cyclic, is_boundary))
 
+        faces_edges = set()
         for face in faces:
-            for face_edge in face.edges:
-                if face_edge.select and face_edge in edges:
-                    edges.remove(face_edge)
+            faces_edges.update(face.edges)
+        edges = [e for e in edges if not (e.select and e in faces_edges)]
 
-    while len(edges) > 0:
-        success, is_boundary, loop_verts, loop_edges = get_loop(edges)
+    for success, is_cyclic, is_boundary, loop_verts, loop_edges in get_edge_loops(edges):
         if success:
-            if len(loop_verts) < 2:
-                is_cyclic = False
-            else:
-                is_cyclic = any((v for v in loop_edges[0].verts if v in loop_edges[-1].verts))
             loops.append(((loop_verts, loop_edges, []), is_cyclic, is_boundary))
 
     return loops
@@ -81,48 +137,46 @@ def get_parallel_edges(edges, verts, perpendicular=False):
     :param perpendicular: If True return perpendicular edges
     :return: tuple of loop edges, first smaller, second bigger
     """
-    sides = ([], [])
-    side_verts = []
-    sides_faces = []
-    len_a = 0
-    len_b = 0
-
-    parallels = []
-    lost = []
+    loop_verts = set(verts)
+    processed_faces = set()
+    processed_edges = set()
+    candidates = []
+    vert_edges = {}
 
     for vert in verts:
         for face in vert.link_faces:
-            if face in sides_faces:
+            if face in processed_faces:
                 continue
-            sides_faces.append(face)
+            processed_faces.add(face)
             for edge in face.edges:
-                if edge not in parallels:
-                    parallels.append(edge)
-                    test = len([v for v in edge.verts if v not in verts])
-                    if test == 2:
-                        if not sides[0] or any((v for v in edge.verts if v in side_verts)):
-                            sides[0].append(edge)
-                            side_verts.extend(edge.verts[:])
-                            len_a += edge.calc_length()
-                        else:
-                            lost.append(edge)
-    processed = []
-    while True:
-        counter = 0
-        for edge in lost:
-            if edge not in processed and any((v for v in edge.verts if v in side_verts)):
-                sides[0].append(edge)
-                side_verts.extend(edge.verts[:])
-                len_a += edge.calc_length()
-                counter += 1
-                processed.append(edge)
-        if counter == 0:
-            break
-
-    for edge in lost:
-        if edge not in processed:
-            sides[1].append(edge)
-            len_b += edge.calc_length()
+                if edge in processed_edges:
+                    continue
+                processed_edges.add(edge)
+                if not any(v in loop_verts for v in edge.verts):
+                    candidates.append(edge)
+                    for v in edge.verts:
+                        vert_edges.setdefault(v, []).append(edge)
+
+    sides = ([], [])
+    if not candidates:
+        return sides
+
+    side = {candidates[0]}
+    frontier = [candidates[0]]
+    while frontier:
+        sides[0].extend(frontier)
+        next_frontier = []
+        for edge in frontier:
+            for vert in edge.verts:
+                for link_edge in vert_edges[vert]:
+                    if link_edge not in side:
+                        side.add(link_edge)
+                        next_frontier.append(link_edge)
+        frontier = next_frontier
+
+    sides[1].extend(e for e in candidates if e not in side)
+    len_a = sum(e.calc_length() for e in sides[0])
+    len_b = sum(e.calc_length() for e in sides[1])
 
     return sides if len_a <= len_b else (sides[1], sides[0])
 
@@ -134,71 +188,113 @@ def get_inner_faces(edges, verts, limit_edges):
     :param verts: Sorted vertices
     :return: Inner loop-faces
     """
-    def search_faces(faces, limit_edges, processed=None):
-        if processed is None:
-            processed = []
-        result = []
-        for face in faces:
-            for edge in face.edges:
-                if edge not in limit_edges:
-                    for search_face in edge.link_faces:
-                        if search_face not in processed and search_face not in result:
-                            result.append(search_face)
-        if result:
-            processed.extend(result)
-        else:
-            return []
-
-        return search_faces(result, limit_edges, processed)
-
+    limit_edges = set(limit_edges)
     parallels = get_parallel_edges(edges, verts)
-    inner_faces = []
 
-    parallel_verts = []
-    for e in parallels[1]:
-        parallel_verts.extend(e.verts[:])
+    parallel_verts = set()
+    for edge in parallels[1]:
+        parallel_verts.update(edge.verts)
 
+    inner_faces = []
+    processed = set()
     for edge in edges:
         if edge in limit_edges:
             continue
         for face in edge.link_faces:
-            if face not in inner_faces and not any((v for v in face.verts if v in parallel_verts)):
+            if face not in processed and not any(v in parallel_verts for v in face.verts):
+                processed.add(face)
                 inner_faces.append(face)
 
     if not parallels[0]:
         return inner_faces
 
-    return inner_faces + search_faces([f for f in reduce(add,
-                                                         [v.link_faces[:] for v in
-                                                          reduce(add, [e.verts[:] for e in parallels[0]])])
-                                       if f not in inner_faces], limit_edges, inner_faces)
+    frontier = []
+    seeds = set()
+    for edge in parallels[0]:
+        for vert in edge.verts:
+            for face in vert.link_faces:
+                if face not in processed and face not in seeds:
+                    seeds.add(face)
+                    frontier.append(face)
+
+    while frontier:
+        next_frontier = []
+        for face in frontier:
+            for edge in face.edges:
+                if edge in limit_edges:
+                    continue
+                for link_face in edge.link_faces:
+                    if link_face not in processed:
+                        processed.add(link_face)
+                        next_frontier.append(link_face)
+        inner_faces.extend(next_frontier)
+        frontier = next_frontier
 
+    return inner_faces
 
-def get_boundary_edges(faces):
+
+def group_regions(faces_edges, edge_faces_count):
+    """
+    Group faces into edge-connected regions with disjoint-set union
+    :param faces_edges: Edge indices of each face
+    :param edge_faces_count: Mapping of edge index to number of all faces linked to the edge
+    :return: list of (boundary edge indices, face positions) tuples, edges linked to faces outside of the given faces
+             are boundary
+    """
+    parents = list(range(len(faces_edges)))
+
+    def find(idx):
+        while parents[idx] != idx:
+            parents[idx] = parents[parents[idx]]
+            idx = parents[idx]
+        return idx
+
+    edge_owner = {}
+    selected_count = {}
+    for idx, face_edges in enumerate(faces_edges):
+        for edge in face_edges:
+            selected_count[edge] = selected_count.get(edge, 0) + 1
+            root, other_root = find(idx), find(edge_owner.setdefault(edge, idx))
+            if root != other_root:
+                parents[max(root, other_root)] = min(root, other_root)
+
+    regions = {}
     result = []
+    for idx, face_edges in enumerate(faces_edges):
+        root = find(idx)
+        if root not in regions:
+            regions[root] = ([], [], set())
+            result.append(regions[root])
+        edges, group, processed = regions[root]
+        group.append(idx)
+        for edge in face_edges:
+            if edge in processed:
+                continue
+            processed.add(edge)
+            if edge_faces_count[edge] > selected_count[edge]:
+                edges.append(edge)
 
-    def get_group(face, faces):
-        group = []
+    return [(edges, group) for edges, group, processed in result]
+
+
+def get_boundary_edges(faces):
+    """
+    Group BMesh faces into edge-connected regions, see group_regions
+    :param faces: Selected faces
+    :return: list of (boundary edges, region faces) tuples
+    """
+    edges = []
+    edges_index = {}
+    faces_edges = []
+    for face in faces:
+        face_edges = []
         for edge in face.edges:
-            tree = [[], []]
-            for idx, edge_face in enumerate(edge.link_faces):
-                if edge_face not in group and edge_face in faces:
-                    group.append(edge_face)
-                    faces.remove(edge_face)
-                    if faces:
-                        tree[idx] = get_group(edge_face, faces)
-            group.extend(tree[0])
-            group.extend(tree[1])
-
-        return group
-
-    while len(faces) > 0:
-        group = get_group(faces[0], faces)
-        edges = []
-        for face in group:
-            for edge in face.edges:
-                for edge_face in edge.link_faces:
-                    if edge_face not in group:
-                        edges.append(edge)
-        result.append((edges, group))
-    return result
+            idx = edges_index.get(edge)
+            if idx is None:
+                idx = edges_index[edge] = len(edges)
+                edges.append(edge)
+            face_edges.append(idx)
+        faces_edges.append(face_edges)
+    edge_faces_count = [len(edge.link_faces) for edge in edges]
+    return [([edges[e] for e in group_edges], [faces[f] for f in group_faces])
+            for group_edges, group_faces in group_regions(faces_edges, edge_faces_count)]
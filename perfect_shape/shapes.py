@@ -0,0 +1,124 @@
+import math
+import numpy
+
+
+def circle(segments, radius):
+    """
+    Return circle vertices, ordered like bmesh.ops.create_circle
+    :param segments: Number of vertices
+    :param radius: Circle radius
+    :return: (N, 3) array of coordinates
+    """
+    theta = numpy.arange(segments) * (2.0 * math.pi / segments)
+    coords = numpy.zeros((segments, 3))
+    coords[:, 0] = -numpy.sin(theta) * radius
+    coords[:, 1] = numpy.cos(theta) * radius
+    return coords
+
+
+def rectangle_segments(verts_count, ratio_a, ratio_b):
+    """
+    Return number of segments on rectangle sides
+    :param verts_count: Number of rectangle vertices
+    :param ratio_a: Ratio of 'a' side
+    :param ratio_b: Ratio of 'b' side
+    :return: tuple of 'a' side segments, 'b' side segments and True if ratio fits vertices count
+    """
+    seg_a = (verts_count / 2) / (ratio_a + ratio_b) * ratio_a
+    seg_b = int((verts_count / 2) / (ratio_a + ratio_b) * ratio_b)
+    is_exact = seg_a % 1 == 0
+    if not is_exact:
+        seg_a += 1
+        seg_b += 2
+    return int(seg_a), seg_b, is_exact
+
+
+def rectangle(verts_count, perimeter, ratio_a, ratio_b, is_square=False):
+    """
+    Return rectangle vertices
+    :param verts_count: Number of rectangle vertices
+    :param perimeter: Rectangle perimeter
+    :param ratio_a: Ratio of 'a' side
+    :param ratio_b: Ratio of 'b' side
+    :param is_square: If True both sides have equal length
+    :return: (N, 3) array of coordinates
+    """
+    size_a = (perimeter / 2) / (ratio_a + ratio_b) * ratio_a
+    size_b = (perimeter / 2) / (ratio_a + ratio_b) * ratio_b
+    seg_a, seg_b, is_exact = rectangle_segments(verts_count, ratio_a, ratio_b)
+    if is_square:
+        size_a = (size_a + size_b) / 2
+        size_b = size_a
+
+    side_a = numpy.linspace(-size_a / 2, size_a / 2, seg_a, endpoint=False)
+    side_b = numpy.linspace(-size_b / 2, size_b / 2, seg_b, endpoint=False)
+    side_a_reversed = numpy.linspace(size_a / 2, -size_a / 2, seg_a, endpoint=False)
+    side_b_reversed = numpy.linspace(size_b / 2, -size_b / 2, seg_b, endpoint=False)
+
+    coords = numpy.zeros((2 * (seg_a + seg_b), 3))
+    coords[:, 0] = numpy.concatenate((numpy.full(seg_a, -size_b / 2), side_b,
+                                      numpy.full(seg_a, size_b / 2), side_b_reversed))
+    coords[:, 1] = numpy.concatenate((side_a, numpy.full(seg_b, size_a / 2),
+                                      side_a_reversed, numpy.full(seg_b, -size_a / 2)))
+    return coords
+
+
+def is_counter_clockwise(coords):
+    """
+    Return True if vertices wind counter-clockwise around Z, the orientation compute_frames gives loops
+    :param coords: (N, 3) array of coordinates
+    """
+    x, y = coords[:, 0], coords[:, 1]
+    return numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(numpy.roll(x, -1), y) > 0
+
+
+def reverse(coords):
+    """
+    Return vertices in reversed order, first vertex is kept
+    :param coords: (N, 3) array of coordinates
+    :return: (N, 3) array of coordinates
+    """
+    return numpy.concatenate((coords[:1], coords[:0:-1]))
+
+
+def from_verts(verts):
+    """
+    Return stored or BMesh vertices coordinates
+    :param verts: Items with 'co' attribute
+    :return: (N, 3) array of coordinates
+    """
+    return numpy.array([v.co[:] for v in verts], dtype=numpy.float64).reshape(-1, 3)
+
+
+def blend(coords, targets, factor):
+    """
+    Linear interpolation of coordinates towards targets
+    :param coords: (N, 3) array of coordinates
+    :param targets: (N, 3) array of target coordinates
+    :param factor: Interpolation factor, 0 keeps coordinates, 1 gives targets
+    :return: (N, 3) array of coordinates
+    """
+    coords = numpy.asarray(coords, dtype=numpy.float64)
+    return coords + (numpy.asarray(targets, dtype=numpy.float64) - coords) * factor
+
+
+def transform(coords, matrix):
+    """
+    Apply 4x4 matrix to coordinates in a single matrix multiply
+    :param coords: (N, 3) array of coordinates
+    :param matrix: 4x4 matrix
+    :return: (N, 3) array of transformed coordinates
+    """
+    matrix = numpy.array(matrix, dtype=numpy.float64)
+    return numpy.dot(coords, matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def project_2d(coords, matrix_rotation):
+    """
+    Return coordinates in the local plane of rotation matrix
+    :param coords: (N, 3) array of coordinates
+    :param matrix_rotation: Rotation matrix, its Z axis is plane normal
+    :return: (N, 2) array of coordinates
+    """
+    matrix = numpy.array(matrix_rotation, dtype=numpy.float64)
+    return numpy.dot(coords, matrix[:3, :2])
@@ -0,0 +1,193 @@
+import multiprocessing
+import numpy
+from perfect_shape import core
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python older than 3.8, per-loop stages run in threads instead
+    shared_memory = None
+
+# Columns of per-loop output: valid flag, frame center, forward, frame reversed flag, rotation multiplier,
+# alignment reversed flag, placement center and placed shape vertices count
+LOOP_COLUMNS = 14
+
+
+def is_available():
+    return shared_memory is not None
+
+
+class SharedArrays:
+    """
+    NumPy arrays in shared memory blocks, workers attach them by handle instead of receiving pickled copies
+
+    Blocks are unlinked when the context exits, also on error or interrupt. Arrays are invalid after that,
+    results must be copied out before.
+    """
+    def __init__(self):
+        self.blocks = []
+        self.arrays = {}
+        self.handles = {}
+
+    def add(self, name, array=None, shape=None, dtype=None):
+        """
+        Create shared array, filled with array data or zeros
+        :return: Shared array
+        """
+        if array is not None:
+            array = numpy.ascontiguousarray(array)
+            shape, dtype = array.shape, array.dtype
+        dtype = numpy.dtype(dtype)
+        block = shared_memory.SharedMemory(create=True, size=max(int(numpy.prod(shape)) * dtype.itemsize, 1))
+        self.blocks.append(block)
+        shared = numpy.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if array is not None:
+            shared[...] = array
+        else:
+            shared.fill(0)
+        self.arrays[name] = shared
+        self.handles[name] = (block.name, shape, dtype.str)
+        return shared
+
+    def close(self):
+        # Views must be released before blocks are closed
+        self.arrays.clear()
+        for block in self.blocks:
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach(handles):
+    """
+    Attach shared arrays in worker process
+    :param handles: Dictionary of handles of SharedArrays
+    :return: tuple of list of blocks, to be closed by caller, and dictionary of arrays
+    """
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in handles.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = numpy.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def pack_loops(loops):
+    """
+    Return loops as flat index arrays with offsets
+    :param loops: Loops of core.find_loops
+    :return: dictionary of arrays
+    """
+    arrays = {}
+    for item, name in enumerate(("verts", "edges", "faces")):
+        counts = [len(loop[0][item]) for loop in loops]
+        offsets = numpy.zeros(len(loops) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
+        arrays["loops_" + name] = numpy.array([idx for loop in loops for idx in loop[0][item]], dtype=numpy.int64)
+        arrays["loops_{}_offsets".format(name)] = offsets
+    arrays["loops_flags"] = numpy.array([(loop[1], loop[2]) for loop in loops], dtype=numpy.int8).reshape(-1, 2)
+    return arrays
+
+
+def unpack_loops(arrays, start, stop):
+    """
+    Return loops of range from arrays of pack_loops
+    """
+    loops = []
+    for idx in range(start, stop):
+        items = [arrays["loops_" + name][arrays["loops_{}_offsets".format(name)][idx]:
+                                         arrays["loops_{}_offsets".format(name)][idx + 1]].tolist()
+                 for name in ("verts", "edges", "faces")]
+        loops.append((tuple(items), bool(arrays["loops_flags"][idx, 0]), bool(arrays["loops_flags"][idx, 1])))
+    return loops
+
+
+def run_chunk(task):
+    """
+    Run per-loop stages on range of loops in worker process, results are written to shared output arrays
+    :param task: tuple of handles, loops range start and stop, selection center and parameters
+    :return: list of warnings
+    """
+    handles, start, stop, selection_center, params = task
+    blocks, arrays = attach(handles)
+    try:
+        loops = unpack_loops(arrays, start, stop)
+        shape_cos, warnings = core.make_shapes(arrays["verts"], arrays["edges"], loops, params)
+        frames = core.compute_frames(arrays["verts"], loops, arrays["normals"], selection_center, params)
+        alignments = core.compute_alignments(arrays["verts"], loops, frames, shape_cos, params)
+        placements = core.compute_placements(frames, alignments, shape_cos, params)
+
+        offsets = arrays["loops_verts_offsets"]
+        for idx, frame, alignment, placement in zip(range(start, stop), frames, alignments, placements):
+            if alignment is None:
+                continue
+            first = offsets[idx]
+            count = min(offsets[idx + 1] - first, len(placement[0]))
+            arrays["out_order"][first:first + len(alignment[0])] = alignment[0]
+            arrays["out_co"][first:first + count] = placement[0][:count]
+            arrays["out_loops"][idx] = ((1,) + frame[0] + frame[1] + (frame[2], frame[3], alignment[2]) +
+                                        placement[1] + (count,))
+        return warnings
+    finally:
+        arrays.clear()
+        for block in blocks:
+            block.close()
+
+
+def run_loop_stages(verts, edges, normals, loops, selection_center, params, workers):
+    """
+    Run shapes, frames, alignment and placement stages of loops in worker processes, mesh and loop arrays are
+    shared with workers instead of being pickled, workers get only handles and loop ranges
+    :return: tuple of frames, alignments, placements (see core stage functions) and warnings, alignments hold
+             no align matrix
+    """
+    with SharedArrays() as shared:
+        shared.add("verts", numpy.asarray(verts, dtype=numpy.float64))
+        shared.add("edges", numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2))
+        shared.add("normals", numpy.asarray(normals, dtype=numpy.float64))
+        for name, array in pack_loops(loops).items():
+            shared.add(name, array)
+        verts_count = int(shared.arrays["loops_verts_offsets"][-1])
+        out_order = shared.add("out_order", shape=(verts_count,), dtype=numpy.int64)
+        out_co = shared.add("out_co", shape=(verts_count, 3), dtype=numpy.float64)
+        out_loops = shared.add("out_loops", shape=(len(loops), LOOP_COLUMNS), dtype=numpy.float64)
+
+        size = max(1, -(-len(loops) // (workers * 4)))
+        selection_center = tuple(numpy.asarray(selection_center, dtype=numpy.float64).tolist())
+        tasks = [(shared.handles, start, min(start + size, len(loops)), selection_center, params)
+                 for start in range(0, len(loops), size)]
+        warnings = []
+        pool = multiprocessing.Pool(workers)
+        try:
+            for chunk_warnings in pool.imap(run_chunk, tasks):
+                warnings.extend(chunk_warnings)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        frames, alignments, placements = [], [], []
+        offsets = shared.arrays["loops_verts_offsets"]
+        for idx, row in enumerate(out_loops.tolist()):
+            if not row[0]:
+                frames.append(None)
+                alignments.append(None)
+                placements.append(None)
+                continue
+            first, last = int(offsets[idx]), int(offsets[idx + 1])
+            frames.append((tuple(row[1:4]), tuple(row[4:7]), bool(row[7]), int(row[8])))
+            alignments.append((out_order[first:last].tolist(), None, bool(row[9])))
+            placements.append((out_co[first:first + int(row[13])].copy(), tuple(row[10:13])))
+        return frames, alignments, placements, warnings
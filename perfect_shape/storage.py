@@ -0,0 +1,92 @@
+import base64
+import numpy
+
+
+def pack_array(array, dtype):
+    """
+    Return array data as ASCII string suitable for string property
+    """
+    return base64.b64encode(numpy.ascontiguousarray(array, dtype=dtype).tobytes()).decode("ascii")
+
+
+def unpack_array(data, dtype, width):
+    """
+    Return read-only (N, width) array from string created by pack_array
+    """
+    return numpy.frombuffer(base64.b64decode(data), dtype=dtype).reshape(-1, width)
+
+
+def get_pattern_arrays(pattern):
+    """
+    Return pattern vertex coordinates and triangles, items of not yet migrated patterns are read in bulk
+    :param pattern: PerfectPattern property group
+    :return: (N, 3) float32 array of coordinates and (K, 3) int32 array of triangle vertex indices
+    """
+    if pattern.is_packed:
+        return unpack_array(pattern.co_data, numpy.float32, 3), unpack_array(pattern.faces_data, numpy.int32, 3)
+    co = numpy.empty(len(pattern.verts) * 3, dtype=numpy.float32)
+    pattern.verts.foreach_get("co", co)
+    faces = numpy.empty(len(pattern.faces) * 3, dtype=numpy.int32)
+    pattern.faces.foreach_get("indices", faces)
+    return co.reshape(-1, 3), faces.reshape(-1, 3)
+
+
+def set_pattern_arrays(pattern, co, faces):
+    """
+    Store pattern as packed arrays, per vertex and per face items are removed
+    :param pattern: PerfectPattern property group
+    :param co: (N, 3) array of coordinates
+    :param faces: (K, 3) array of triangle vertex indices
+    """
+    co = numpy.asarray(co, dtype=numpy.float32).reshape(-1, 3)
+    pattern.co_data = pack_array(co, numpy.float32)
+    pattern.faces_data = pack_array(numpy.asarray(faces, dtype=numpy.int32).reshape(-1, 3), numpy.int32)
+    pattern.verts_count = len(co)
+    pattern.is_packed = True
+    pattern.verts.clear()
+    pattern.faces.clear()
+
+
+def get_verts_count(pattern):
+    return pattern.verts_count if pattern.is_packed else len(pattern.verts)
+
+
+def migrate_pattern(pattern):
+    """
+    Convert pattern stored as Vert/Face items to packed arrays
+    :return: True if pattern was converted
+    """
+    if pattern.is_packed or len(pattern.verts) == 0:
+        return False
+    set_pattern_arrays(pattern, *get_pattern_arrays(pattern))
+    return True
+
+
+def new_pattern_uid(settings):
+    """
+    Return next unique pattern ID of scene, IDs are never reused
+    :param settings: PerfectShapeProperties property group
+    """
+    settings.last_pattern_uid += 1
+    return settings.last_pattern_uid
+
+
+def ensure_pattern_uids(settings):
+    """
+    Assign IDs to patterns created before IDs were introduced, active pattern stored by such files as pattern
+    position is changed to ID of that pattern
+    :return: True if any pattern was changed
+    """
+    missing = [pattern for pattern in settings.patterns if pattern.uid == 0]
+    if not missing:
+        return False
+    is_legacy = len(missing) == len(settings.patterns)
+    settings.last_pattern_uid = max([settings.last_pattern_uid] + [pattern.uid for pattern in settings.patterns])
+    for pattern in missing:
+        pattern.uid = new_pattern_uid(settings)
+    if is_legacy:
+        # Raw enum value, item lookup of stored position would fail with new identifiers
+        position = settings.get("active_pattern", 0)
+        if 0 <= position < len(settings.patterns):
+            settings["active_pattern"] = settings.patterns[position].uid
+    return True
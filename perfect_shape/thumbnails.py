@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sys
+import zlib
+import numpy
+
+# Icon file: magic, image size and zlib compressed RGBA8 pixels
+MAGIC = b"PSI2"
+
+
+def default_directory():
+    """
+    Return per-user cache directory for preview icons
+    """
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "perfect_shape", "icons")
+
+
+def icon_key(verts, faces, colors, size):
+    """
+    Return content hash of icon inputs
+    :param verts: Shape outline vertices
+    :param faces: Triangles vertex indices or None
+    :param colors: Theme colors used for drawing
+    :param size: Image width and height in pixels
+    :return: Hex digest
+    """
+    key = hashlib.sha1(numpy.asarray(verts, dtype=numpy.float32).tobytes())
+    key.update(b"P" if faces is None else numpy.asarray(faces, dtype=numpy.int32).tobytes())
+    for color in colors:
+        key.update(numpy.asarray(color[:], dtype=numpy.float32).tobytes())
+    key.update(str(size).encode())
+    return key.hexdigest()
+
+
+class ThumbnailCache:
+    """
+    Content addressed on-disk cache of icon pixels with size bounded LRU eviction
+
+    Icons are mostly flat background and compress to about 7 KB at 200x200, the default limit keeps about 9000 of
+    them, enough for a large pattern library. Total size is counted in memory, the directory is listed only once
+    and when eviction is needed.
+    """
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.total = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".icon")
+
+    def get(self, key):
+        """
+        Return cached pixels as flat RGBA float32 array or None
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        if data[:4] != MAGIC:
+            return None
+        size = int.from_bytes(data[4:8], "little")
+        try:
+            pixels = numpy.frombuffer(zlib.decompress(data[8:]), dtype=numpy.uint8)
+        except zlib.error:
+            return None
+        if len(pixels) != size * size * 4:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return pixels.astype(numpy.float32) / 255.0
+
+    def put(self, key, pixels, size):
+        """
+        Store flat RGBA float pixels as compressed 8 bit data and evict least recently used icons over the size limit
+        """
+        data = numpy.clip(numpy.round(numpy.asarray(pixels, dtype=numpy.float32) * 255.0), 0, 255)
+        data = MAGIC + size.to_bytes(4, "little") + zlib.compress(data.astype(numpy.uint8).tobytes(), 6)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.total is None:
+                self.total = sum(entry[1] for entry in self.entries())
+            path = self.path(key)
+            try:
+                self.total -= os.stat(path).st_size
+            except OSError:
+                pass
+            temp_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+            self.total += len(data)
+            if self.total > self.max_bytes:
+                self.evict()
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        Return list of (modification time, size, path) of cached icons
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".icon"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        # Other Blender instances may share the directory, total is recounted before removing files. Eviction goes
+        # below the limit so that the directory is not listed again on each following put
+        entries = sorted(self.entries())
+        self.total = sum(entry[1] for entry in entries)
+        for mtime, size, path in entries:
+            if self.total <= self.max_bytes * 0.9:
+                break
+            os.remove(path)
+            self.total -= size
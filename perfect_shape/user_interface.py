@@ -1,5 +1,6 @@
 import bpy
 from perfect_shape.properties import PerfectShape
+from perfect_shape.utils import get_pattern_summary, find_pattern
 
 
 class PerfectShapePanel(bpy.types.Panel):
@@ -21,17 +22,25 @@ class PerfectShapePanel(bpy.types.Panel):
                 if operator.target in bpy.data.objects:
                     col.operator("mesh.perfect_shape", text="Edit Shape Object")
         col = layout.column(align=True)
-        if len(scene.perfect_shape.patterns) > 0:
-            pattern = scene.perfect_shape.patterns[int(scene.perfect_shape.active_pattern)]
-            col.label("Active Pattern ({} Verts):".format(len(pattern.verts)))
+        idx = scene.perfect_shape.active_pattern
+        summary = get_pattern_summary(scene, idx)
+        if summary is not None:
+            name, verts_count, is_library = summary
+            col.label("Active Pattern ({} Verts):".format(verts_count))
             col.template_icon_view(scene.perfect_shape, "active_pattern", show_labels=True)
             col = layout.column(align=True)
-            col.prop(pattern, "name", text="")
-            col.operator("mesh.perfect_pattern_remove")
+            if is_library:
+                col.label(name)
+            else:
+                col.prop(find_pattern(scene, idx), "name", text="")
+                col.operator("mesh.perfect_pattern_remove")
+                col.operator("mesh.perfect_pattern_to_library")
             col = layout.column(align=True)
             col.operator("mesh.perfect_pattern_add", text="Mark New Pattern")
         else:
             col.operator("mesh.perfect_pattern_add")
+        col = layout.column(align=True)
+        col.prop(scene.perfect_shape, "library_path", text="")
 
 
 class PerfectShapeUI(PerfectShape):
@@ -96,6 +105,8 @@ class PerfectShapeUI(PerfectShape):
             row.prop(self, "shift")
             row.prop(self, "loop_rotation", text="Loop", toggle=True)
             row.prop(self, "shape_rotation", text="Shape", toggle=True)
+            row.prop(self, "fit_rotation", text="Fit", toggle=True)
+            row.prop(self, "reverse_correspondence", text="Reverse", toggle=True)
 
             col = box.column(align=True)
             row = col.row(align=True)
@@ -2,39 +2,64 @@ import bpy
 import bpy.utils.previews
 from bpy.app.handlers import persistent
 import math
-from mathutils import Vector
+import numpy
 import time
-
-
-class CacheException(Exception):
-    pass
-
-cache = {}
-
-
-def get_cache(op_pointer, key):
-    if op_pointer not in cache.keys():
-        raise CacheException("No operator cache")
-    if key not in cache[op_pointer].keys():
-        raise CacheException("No key cache")
-    return cache[op_pointer][key]
-
-
-def set_cache(op_pointer, key, value):
-    if op_pointer not in cache.keys():
-        if len(cache) > 0:
-            cache.clear()
-        cache[op_pointer] = {}
-    cache[op_pointer][key] = value
-
-
-def clear_cache(op_pointer=None, key=None):
-    if op_pointer or key is None:
-        cache.clear()
-    else:
-        if op_pointer in cache:
-            if key in op_pointer:
-                del cache[op_pointer][key]
+from collections import OrderedDict
+from perfect_shape.raster import render_icon
+from perfect_shape.thumbnails import ThumbnailCache, icon_key
+from perfect_shape.storage import get_pattern_arrays, get_verts_count
+from perfect_shape.library import open_library
+
+
+def get_mesh_arrays(mesh):
+    """
+    Read mesh geometry in bulk
+    :param mesh: Mesh data, synchronized with edit-mode
+    :return: tuple of vertex coordinates, polygons loop start, polygons loop total and loops vertex index arrays
+    """
+    verts_co = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", verts_co)
+    polygons_start = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_start", polygons_start)
+    polygons_total = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_total", polygons_total)
+    loops_vert = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loops_vert)
+    return verts_co.reshape(-1, 3).astype(numpy.float64), polygons_start, polygons_total, loops_vert
+
+
+def get_mesh_edges(mesh):
+    """
+    Read mesh edges in bulk
+    :return: (E, 2) array of edge vertex indices
+    """
+    edges = numpy.empty(len(mesh.edges) * 2, dtype=numpy.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    return edges.reshape(-1, 2)
+
+
+def get_mesh_selection(mesh):
+    """
+    Read selection flags in bulk
+    :param mesh: Mesh data, synchronized with edit-mode
+    :return: tuple of selected vertex, edge and face indices arrays
+    """
+    selection = []
+    for items in (mesh.vertices, mesh.edges, mesh.polygons):
+        select = numpy.empty(len(items), dtype=bool)
+        items.foreach_get("select", select)
+        selection.append(numpy.flatnonzero(select))
+    return tuple(selection)
+
+
+def get_mesh_normals(mesh):
+    """
+    Read mesh vertex normals in bulk
+    :return: (V, 3) array of vertex normals
+    """
+    normals = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("normal", normals)
+    return normals.reshape(-1, 3).astype(numpy.float64)
 
 
 def select_only(bm, geom, mode={"VERT"}):
@@ -47,11 +72,65 @@ def select_only(bm, geom, mode={"VERT"}):
             ele.select_set(True)
 
 
+class IconScheduler:
+    """
+    Debounced queue of icon regeneration requests, duplicates are coalesced and the scene update handler
+    is attached only while requests are pending
+    """
+    def __init__(self, delay=0.2, batch=8):
+        self.delay = delay
+        self.batch = batch
+        self.pending = OrderedDict()
+        self.update_time = None
+
+    def request(self, kind, name=None, first=False):
+        """
+        Queue regeneration of 'shape_types' icons, all 'patterns' icons, single 'pattern' or 'library_pattern' icon
+        :param first: Move request to front of queue, for icons which are visible
+        """
+        self.pending[(kind, name)] = None
+        if first:
+            self.pending.move_to_end((kind, name), last=False)
+        self.update_time = time.time()
+        if handler not in bpy.app.handlers.scene_update_post:
+            bpy.app.handlers.scene_update_post.append(handler)
+
+    def cancel(self):
+        self.pending.clear()
+        if handler in bpy.app.handlers.scene_update_post:
+            bpy.app.handlers.scene_update_post.remove(handler)
+
+    def run(self):
+        obj = bpy.context.object
+        if obj is not None and obj.is_updated_data:
+            self.update_time = time.time()
+        if time.time() - self.update_time <= self.delay:
+            return
+
+        pending = self.pending.copy()
+        self.cancel()
+        library_requests = [item for item in pending if item[0] == "library_pattern"]
+        deferred = set(library_requests[self.batch:])
+        for kind, name in pending:
+            if kind == "shape_types":
+                generate_icons()
+            elif kind == "patterns":
+                generate_patterns_icons()
+            elif kind == "pattern" and ("patterns", None) not in pending:
+                generate_pattern_icon(name)
+            elif kind == "library_pattern" and (kind, name) not in deferred:
+                generate_library_pattern_icon(name)
+        if deferred:
+            # Rest of library icons is rendered in following runs, in the same order
+            for item in library_requests[self.batch:]:
+                self.pending[item] = None
+            self.update_time = time.time()
+            if handler not in bpy.app.handlers.scene_update_post:
+                bpy.app.handlers.scene_update_post.append(handler)
+
+
 def refresh_icons():
-    global draw
-    global update_time
-    draw = True
-    update_time = time.time()
+    icon_scheduler.request("shape_types")
 
 
 def get_icon(name, coll="shape_types"):
@@ -64,8 +143,102 @@ def get_icon(name, coll="shape_types"):
     return preview.icon_id
 
 
+def get_pattern_icon(identifier, first=False):
+    """
+    Return icon of 'active_pattern' item, library icons are requested when an item asks for them
+    :param first: Icon is visible, it is rendered before other requested icons
+    """
+    if is_library_pattern(identifier) and identifier not in library_icons:
+        key = ("library_pattern", int(identifier[1:]))
+        pending = icon_scheduler.pending
+        # Repeated requests of a redrawn item would postpone the debounced run
+        if key not in pending or (first and next(iter(pending)) != key):
+            icon_scheduler.request(*key, first=first)
+    return get_icon(identifier, "patterns")
+
+
+def remove_library_icons():
+    pcoll = preview_collections["patterns"]
+    for name in [name for name in pcoll.keys() if is_library_pattern(name)]:
+        del pcoll[name]
+    library_icons.clear()
+
+
 preview_collections = {}
-draw = False
+# Identifiers of rendered library icons, items of enum get empty icons before
+library_icons = set()
+thumbnail_cache = ThumbnailCache()
+icon_scheduler = IconScheduler()
+
+
+def get_library(scene):
+    return open_library(bpy.path.abspath(scene.perfect_shape.library_path))
+
+
+def is_library_pattern(identifier):
+    return identifier.startswith("L")
+
+
+pattern_indices = {}
+
+
+def find_pattern_index(scene, identifier):
+    """
+    Return position of scene pattern of given ID, the ID to position index is rebuilt only when it is out of date
+    :param identifier: 'active_pattern' enum identifier
+    :return: Index or None
+    """
+    if not identifier or is_library_pattern(identifier):
+        return None
+    patterns = scene.perfect_shape.patterns
+    uid = int(identifier)
+    idx = pattern_indices.get(scene.as_pointer(), {}).get(uid)
+    if idx is None or idx >= len(patterns) or patterns[idx].uid != uid:
+        index = {pattern.uid: idx for idx, pattern in enumerate(patterns)}
+        pattern_indices[scene.as_pointer()] = index
+        idx = index.get(uid)
+    return idx
+
+
+def find_pattern(scene, identifier):
+    idx = find_pattern_index(scene, identifier)
+    return None if idx is None else scene.perfect_shape.patterns[idx]
+
+
+def get_pattern_summary(scene, identifier):
+    """
+    Return pattern name, vertices count and library flag without reading pattern data
+    :param identifier: 'active_pattern' enum identifier
+    :return: tuple or None if there is no such pattern
+    """
+    if is_library_pattern(identifier):
+        library = get_library(scene)
+        idx = int(identifier[1:])
+        if library is None or idx >= len(library):
+            return None
+        return library.name(idx), library.verts_count(idx), True
+    pattern = find_pattern(scene, identifier)
+    if pattern is None:
+        return None
+    return pattern.name, get_verts_count(pattern), False
+
+
+def get_pattern_data(scene, identifier):
+    """
+    Return coordinates and triangles of scene or library pattern
+    :param identifier: 'active_pattern' enum identifier
+    :return: (N, 3) float32 array and (K, 3) int32 array or None if there is no such pattern
+    """
+    if is_library_pattern(identifier):
+        library = get_library(scene)
+        idx = int(identifier[1:])
+        if library is None or idx >= len(library):
+            return None
+        return library.get(idx)
+    pattern = find_pattern(scene, identifier)
+    if pattern is None:
+        return None
+    return get_pattern_arrays(pattern)
 
 
 def generate_icons():
@@ -122,36 +295,41 @@ def generate_icons():
     suzanne_faces = [[3, 1, 9], [0, 9, 1], [3, 7, 4], [1, 3, 2], [22, 21, 23], [19, 18, 20], [21, 15, 23], [4, 6, 5],
                      [23, 15, 0], [18, 17, 20], [16, 21, 17], [12, 14, 13], [15, 21, 16], [11, 10, 12], [17, 21, 20],
                      [12, 10, 14], [7, 3, 8], [10, 15, 14], [6, 4, 7], [9, 15, 10], [15, 9, 0], [3, 9, 8]]
-    object_verts = bpy.context.scene.perfect_shape.shape.verts
-    object_faces = bpy.context.scene.perfect_shape.shape.faces
-    if len(object_verts) == 0:
+    object_co, object_faces = get_pattern_arrays(bpy.context.scene.perfect_shape.shape)
+    if len(object_co) == 0:
         generate_icon("object", suzanne, suzanne_faces)
     else:
-        verts = []
-        length = 0
-        for vert in object_verts:
-            v = Vector(vert.co[:2])
-            verts.append(v)
-            if v.length > length:
-                length = v.length
-        scale = 0.9 / length
-        generate_icon("object", [v*scale for v in verts], [f.indices for f in object_faces])
+        generate_icon("object", *get_icon_arrays(object_co, object_faces))
 
 
 def generate_patterns_icons():
     pcoll = preview_collections["patterns"]
-    patterns = bpy.context.scene.perfect_shape.patterns
-    for idx, pattern in enumerate(patterns):
-        if str(idx) not in pcoll:
-            verts= []
-            length = 0
-            for vert in pattern.verts:
-                v = Vector(vert.co[:2])
-                verts.append(v)
-                if v.length > length:
-                    length = v.length
-            scale = 0.9 / length
-            generate_icon(str(idx), [v*scale for v in verts], [f.indices for f in pattern.faces], "patterns")
+    for pattern in bpy.context.scene.perfect_shape.patterns:
+        if str(pattern.uid) not in pcoll:
+            generate_pattern_icon(str(pattern.uid))
+
+
+def generate_pattern_icon(identifier):
+    pattern = find_pattern(bpy.context.scene, identifier)
+    if pattern is None:
+        return
+    generate_icon(identifier, *get_icon_arrays(*get_pattern_arrays(pattern)), coll="patterns")
+
+
+def generate_library_pattern_icon(idx):
+    library = get_library(bpy.context.scene)
+    if library is None or idx >= len(library):
+        return
+    generate_icon("L{}".format(idx), *get_icon_arrays(*library.get(idx)), coll="patterns")
+    library_icons.add("L{}".format(idx))
+
+
+def get_icon_arrays(co, faces):
+    """
+    Return outline coordinates scaled to icon bounds and faces
+    """
+    verts = co[:, :2]
+    return verts * (0.9 / numpy.sqrt((verts * verts).sum(axis=1)).max()), faces
 
 
 def generate_icon(name, verts=None, faces=None, coll="shape_types"):
@@ -163,109 +341,34 @@ def generate_icon(name, verts=None, faces=None, coll="shape_types"):
         thumb.image_size = (200, 200)
 
     if verts is not None:
-        import bgl
-
-        polygon_color = bpy.context.user_preferences.themes[0].view_3d.edge_facesel
-        edge_color = bpy.context.user_preferences.themes[0].view_3d.edge_select
-        vertex_color = bpy.context.user_preferences.themes[0].view_3d.vertex_select
+        view_3d = bpy.context.user_preferences.themes[0].view_3d
         clear_color = bpy.context.user_preferences.themes[0].user_interface.wcol_menu.inner
+        colors = (view_3d.edge_facesel, view_3d.edge_select, view_3d.vertex_select, clear_color)
+        key = icon_key(verts, faces, colors, 200)
+        pixels = thumbnail_cache.get(key)
+        if pixels is None:
+            pixels = render_icon(verts, faces, *colors, size=200)
+            thumbnail_cache.put(key, pixels, 200)
+        thumb.image_pixels_float = pixels
 
-        viewport_info = bgl.Buffer(bgl.GL_INT, 4)
-        bgl.glGetIntegerv(bgl.GL_VIEWPORT, viewport_info)
-        buffer = bgl.Buffer(bgl.GL_FLOAT, 200 * 200 * 4)
-
-        bgl.glDisable(bgl.GL_SCISSOR_TEST)
-        bgl.glBlendFunc(bgl.GL_SRC_ALPHA, bgl.GL_ONE_MINUS_SRC_ALPHA)
-        bgl.glEnable(bgl.GL_LINE_SMOOTH)
-        bgl.glEnable(bgl.GL_POINT_SMOOTH)
-        bgl.glViewport(0, 0, 200, 200)
-
-        bgl.glMatrixMode(bgl.GL_MODELVIEW)
-        bgl.glPushMatrix()
-        bgl.glLoadIdentity()
-
-        bgl.glMatrixMode(bgl.GL_PROJECTION)
-        bgl.glPushMatrix()
-        bgl.glLoadIdentity()
-        bgl.gluOrtho2D(0, 0, 0, 0)
-
-        bgl.glLineWidth(4.0)
-        bgl.glPointSize(10.0)
-
-        bgl.glClearColor(*clear_color)
-        bgl.glClear(bgl.GL_COLOR_BUFFER_BIT | bgl.GL_DEPTH_BUFFER_BIT)
-
-        if faces is None:
-            bgl.glBegin(bgl.GL_POLYGON)
-            bgl.glColor3f(*polygon_color)
-            for vert in verts:
-                bgl.glVertex2f(*vert)
-            bgl.glEnd()
-        else:
-            bgl.glBegin(bgl.GL_TRIANGLES)
-            bgl.glColor3f(*polygon_color)
-            for face in faces:
-                bgl.glVertex2f(*verts[face[0]])
-                bgl.glVertex2f(*verts[face[1]])
-                bgl.glVertex2f(*verts[face[2]])
-            bgl.glEnd()
-
-        bgl.glBegin(bgl.GL_LINE_LOOP)
-        bgl.glColor3f(*edge_color)
-        for vert in verts:
-            bgl.glVertex2f(*vert)
-        bgl.glEnd()
-
-        bgl.glBegin(bgl.GL_POINTS)
-        bgl.glColor3f(*vertex_color)
-        for vert in verts:
-            bgl.glVertex2f(*vert)
-        bgl.glEnd()
-
-        bgl.glReadPixels(0, 0, 200, 200, bgl.GL_RGBA, bgl.GL_FLOAT, buffer)
-        bgl.glEnable(bgl.GL_SCISSOR_TEST)
-        bgl.glLineWidth(1.0)
-        bgl.glPointSize(1.0)
-
-        buffer = buffer[:]
-        for idx in range(0, 200 * 200 * 4, 4):
-            if buffer[idx] == clear_color[0] and \
-                            buffer[idx + 1] == clear_color[1] and buffer[idx + 2] == clear_color[2]:
-                buffer[idx + 3] = 0.0
-
-        thumb.image_pixels_float = buffer
-
-update_time = None
 
-
-@persistent
 def handler(scene):
-    global draw
-    global update_time
-
-    obj = bpy.context.object
-    if draw:
-        if obj is not None:
-            if update_time is None:
-                update_time = time.time()
-            if bpy.context.object.is_updated_data:
-                update_time = time.time()
-            if time.time() - update_time > 0.2:
-                generate_icons()
-                draw = False
+    icon_scheduler.run()
 
 
 @persistent
 def load_handler(scene):
+    icon_scheduler.cancel()
+    pattern_indices.clear()
     for pcoll in preview_collections.values():
         pcoll.clear()
-        generate_patterns_icons()
+    library_icons.clear()
+    icon_scheduler.request("patterns")
 
 
 def register():
     preview_collections["shape_types"] = bpy.utils.previews.new()
     preview_collections["patterns"] = bpy.utils.previews.new()
-    bpy.app.handlers.scene_update_post.append(handler)
     bpy.app.handlers.load_post.append(load_handler)
 
 
@@ -273,5 +376,5 @@ def unregister():
     for pcoll in preview_collections.values():
         bpy.utils.previews.remove(pcoll)
     preview_collections.clear()
-    bpy.app.handlers.scene_update_post.remove(handler)
+    icon_scheduler.cancel()
     bpy.app.handlers.load_post.remove(load_handler)
@@ -0,0 +1,42 @@
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from perfect_shape.correspondence import cyclic_shift, fit_rotation
+
+
+def displacement(loop_co, shape_co, shift):
+    count = min(len(loop_co), len(shape_co))
+    order = (numpy.arange(count) + shift) % len(loop_co)
+    return ((loop_co[order] - shape_co[:count]) ** 2).sum()
+
+
+def test_cyclic_shift_fewer_shape_vertices():
+    # Shape matches loop vertices 3..7 exactly, the far vertex 0 must not pull the match away from them
+    loop_co = numpy.array([[10.0, 0], [1, 1], [0, 1], [-1, 1], [-1, 0], [-1, -1], [0, -1], [1, -1]])
+    shape_co = loop_co[3:8].copy()
+    assert cyclic_shift(loop_co, shape_co) == (3, False)
+
+
+def test_cyclic_shift_matches_brute_force():
+    rng = numpy.random.RandomState(0)
+    for loop_count, shape_count in ((12, 7), (9, 1), (8, 8), (6, 10)):
+        for _ in range(20):
+            loop_co = rng.uniform(-1, 1, (loop_count, 2)) * rng.uniform(0.1, 5, (loop_count, 1))
+            shape_co = rng.uniform(-1, 1, (shape_count, 2))
+            shift, is_reversed = cyclic_shift(loop_co, shape_co)
+            costs = [displacement(loop_co, shape_co, s) for s in range(loop_count)]
+            assert not is_reversed
+            assert numpy.isclose(costs[shift], min(costs))
+
+
+def test_fit_rotation_fewer_shape_vertices():
+    angles = numpy.linspace(0, 2 * numpy.pi, 10, endpoint=False)
+    loop_co = numpy.column_stack((numpy.cos(angles), numpy.sin(angles))) * numpy.linspace(1, 3, 10)[:, None]
+    rotation = 0.4
+    matrix = numpy.array([[numpy.cos(rotation), -numpy.sin(rotation)], [numpy.sin(rotation), numpy.cos(rotation)]])
+    # Loop vertices 2..7 are the shape rotated by 0.4 radians
+    shape_co = loop_co[2:8].dot(matrix)
+    assert numpy.isclose(fit_rotation(loop_co, shape_co), rotation)